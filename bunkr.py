@@ -1,4 +1,3 @@
-import cloudscraper
 import json
 import re
 import base64
@@ -6,11 +5,17 @@ from math import floor
 from urllib.parse import unquote, urlparse, urljoin
 from bs4 import BeautifulSoup
 
+from scraperpool import pool
+
+# Upper bound on album pages followed, in case a site links pages in a loop
+MAX_PAGES = 50
+
 class Bunkr:
-    def __init__(self):
-        self.scraper = cloudscraper.create_scraper(
-            browser={'browser': 'chrome', 'platform': 'windows', 'mobile': False}
-        )
+    def __init__(self, route=None):
+        # egress.Route to send the scrape through (proxy or source address)
+        self.route = route
+        # Borrowed from the shared pool for the length of each scrape
+        self.scraper = None
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': '*/*',
@@ -36,53 +41,72 @@ class Bunkr:
             return "".join(decrypted)
         except: return None
 
+    def _next_page(self, soup, url, visited):
+        """URL of the next album page, or None on the last one."""
+        link = soup.find(['a', 'link'], rel='next')
+        if not link:
+            link = soup.find('a', string=re.compile(r'^\s*(next|›|»)\s*$', re.I))
+        if not link or not link.get('href'):
+            return None
+        next_url = urljoin(url, link['href'])
+        if next_url in visited or len(visited) >= MAX_PAGES:
+            return None
+        return next_url
+
     def _scrape_bunkr(self, url):
+        """Yield files as their slugs are decrypted, following album pagination."""
         print(f"Scraper: Bunkr -> {url}")
         api_url, referer = self._bunkr_get_api_url(url)
+        slug_regex = r'/(?:v|i|f)/([a-zA-Z0-9\-_]+)'
+        seen = set()
+        visited = set()
+        page_url = url
         try:
-            r = self.scraper.get(url, headers={'Referer': referer}, timeout=15)
-            soup = BeautifulSoup(r.text, 'html.parser')
-            files_map = {} 
-            slug_regex = r'/(?:v|i|f)/([a-zA-Z0-9\-_]+)'
-
-            match_self = re.search(slug_regex, url)
-            if match_self and ("Download" in r.text or soup.find('div', {'class': 'lightgallery'})):
-                slug = match_self.group(1)
-                h1 = soup.find('h1')
-                files_map[slug] = h1.text.strip() if h1 else f"bunkr_{slug}.mp4"
-
-            links = soup.find_all('a', href=re.compile(slug_regex))
-            for link in links:
-                match = re.search(slug_regex, link.get('href'))
-                if not match: continue
-                slug = match.group(1)
-                
-                name = None
-                if link.text.strip() and "Download" not in link.text: name = link.text.strip()
-                if not name and link.find_parent('div'):
-                    txt = link.find_parent('div').get_text(strip=True, separator=" ")
-                    clean = re.sub(r'\d{1,2}:\d{2}', '', txt).strip()
-                    if len(clean) > 2: name = clean
-                
-                files_map[slug] = name or f"bunkr_{slug}.mp4"
-
-            results = []
-            for slug, name in files_map.items():
-                name = re.sub(r'[^\w\-. ]', '', name.replace("Watch", "").strip())
-                if not name.endswith(('.mp4', '.jpg', '.png', '.mkv')): name += ".mp4"
-                
-                try:
-                    h = self.headers.copy()
-                    h['Referer'] = referer
-                    api = self.scraper.post(api_url, json={'slug': slug}, headers=h, timeout=10)
-                    if api.status_code == 200:
-                        direct = self._bunkr_decrypt(api.json())
-                        if direct: results.append({'url': direct, 'name': name, 'referer': referer})
-                except: pass
-            return results
+            while page_url:
+                visited.add(page_url)
+                r = self.scraper.get(page_url, headers={'Referer': referer}, timeout=15)
+                soup = BeautifulSoup(r.text, 'html.parser')
+                files_map = {} 
+
+                match_self = re.search(slug_regex, page_url)
+                if match_self and ("Download" in r.text or soup.find('div', {'class': 'lightgallery'})):
+                    slug = match_self.group(1)
+                    h1 = soup.find('h1')
+                    files_map[slug] = h1.text.strip() if h1 else f"bunkr_{slug}.mp4"
+
+                links = soup.find_all('a', href=re.compile(slug_regex))
+                for link in links:
+                    match = re.search(slug_regex, link.get('href'))
+                    if not match: continue
+                    slug = match.group(1)
+                    
+                    name = None
+                    if link.text.strip() and "Download" not in link.text: name = link.text.strip()
+                    if not name and link.find_parent('div'):
+                        txt = link.find_parent('div').get_text(strip=True, separator=" ")
+                        clean = re.sub(r'\d{1,2}:\d{2}', '', txt).strip()
+                        if len(clean) > 2: name = clean
+                    
+                    files_map[slug] = name or f"bunkr_{slug}.mp4"
+
+                for slug, name in files_map.items():
+                    if slug in seen: continue
+                    seen.add(slug)
+                    name = re.sub(r'[^\w\-. ]', '', name.replace("Watch", "").strip())
+                    if not name.endswith(('.mp4', '.jpg', '.png', '.mkv')): name += ".mp4"
+                    
+                    try:
+                        h = self.headers.copy()
+                        h['Referer'] = referer
+                        api = self.scraper.post(api_url, json={'slug': slug}, headers=h, timeout=10)
+                        if api.status_code == 200:
+                            direct = self._bunkr_decrypt(api.json())
+                            if direct: yield {'url': direct, 'name': name, 'referer': referer}
+                    except Exception: pass
+
+                page_url = self._next_page(soup, page_url, visited)
         except Exception as e:
             print(f"Bunkr Error: {e}")
-            return []
 
     # ==========================
     # 2. IMGCHEST LOGIC (FIXED)
@@ -153,21 +177,27 @@ class Bunkr:
     # 3. CYBERDROP & EROME
     # ==========================
     def _scrape_cyberdrop(self, url):
+        """Yield files page by page, following album pagination."""
+        count = 0
+        visited = set()
+        page_url = url
         try:
-            r = self.scraper.get(url, headers=self.headers, timeout=15)
-            soup = BeautifulSoup(r.text, 'html.parser')
-            results = []
-            links = soup.find_all('a', class_='image') or soup.find_all('a', href=re.compile(r'\.(mp4|jpg|png|jpeg|mkv)$', re.I))
-            for link in links:
-                href = link.get('href')
-                if not href: continue
-                full_url = urljoin(url, href)
-                name = link.get('title') or link.text.strip() or href.split('/')[-1]
-                name = re.sub(r'[^\w\-. ]', '', name)
-                if not name: name = f"cyber_{len(results)}.mp4"
-                results.append({'url': full_url, 'name': name, 'referer': url})
-            return results
-        except: return []
+            while page_url:
+                visited.add(page_url)
+                r = self.scraper.get(page_url, headers=self.headers, timeout=15)
+                soup = BeautifulSoup(r.text, 'html.parser')
+                links = soup.find_all('a', class_='image') or soup.find_all('a', href=re.compile(r'\.(mp4|jpg|png|jpeg|mkv)$', re.I))
+                for link in links:
+                    href = link.get('href')
+                    if not href: continue
+                    full_url = urljoin(page_url, href)
+                    name = link.get('title') or link.text.strip() or href.split('/')[-1]
+                    name = re.sub(r'[^\w\-. ]', '', name)
+                    if not name: name = f"cyber_{count}.mp4"
+                    count += 1
+                    yield {'url': full_url, 'name': name, 'referer': url}
+                page_url = self._next_page(soup, page_url, visited)
+        except Exception: return
 
     def _scrape_erome(self, url):
         try:
@@ -193,10 +223,14 @@ class Bunkr:
     # ==========================
     # ROUTER
     # ==========================
-    def get_files(self, url):
+    def iter_files(self, url):
+        """Yield files as they are discovered, so downloads can start before the scrape ends."""
         url_lower = url.lower()
-        if "bunkr" in url_lower: return self._scrape_bunkr(url)
-        elif "imgchest" in url_lower: return self._scrape_imgchest(url)
-        elif any(x in url_lower for x in ["cyberdrop", "cyberfile"]): return self._scrape_cyberdrop(url)
-        elif "erome" in url_lower: return self._scrape_erome(url)
-        return []
+        with pool.session(url, self.route) as self.scraper:
+            if "bunkr" in url_lower: yield from self._scrape_bunkr(url)
+            elif "imgchest" in url_lower: yield from self._scrape_imgchest(url)
+            elif any(x in url_lower for x in ["cyberdrop", "cyberfile"]): yield from self._scrape_cyberdrop(url)
+            elif "erome" in url_lower: yield from self._scrape_erome(url)
+
+    def get_files(self, url):
+        return list(self.iter_files(url))
@@ -0,0 +1,237 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from threading import Lock, Thread
+from urllib.parse import urlparse
+
+from tuner import host_key
+
+log = logging.getLogger("EGRESS")
+
+# Comma-separated egress routes: proxy URLs (http://, https://, socks5://) or
+# local source addresses to bind to. Empty means a single direct route.
+EGRESS_ROUTES = os.getenv("EGRESS_ROUTES", "")
+# Hosts that must keep seeing one address for a session (Cloudflare clearance is per IP)
+STICKY_HOSTS = tuple(h for h in os.getenv("EGRESS_STICKY_HOSTS", "bunkr,cyberdrop,cyberfile").split(",") if h)
+HEALTH_URL = os.getenv("EGRESS_HEALTH_URL", "https://www.gstatic.com/generate_204")
+HEALTH_INTERVAL = 60
+# Consecutive failures before a route is taken out until its next successful check
+MAX_FAILURES = 3
+# Smoothing of the per-route throughput estimate
+RATE_ALPHA = 0.3
+
+# requests and aiohttp are imported on first use: this module loads at startup
+
+
+class NoRoute(Exception):
+    pass
+
+
+def source_address_adapter(source: str):
+    """A requests HTTPAdapter whose connections originate from a given local address."""
+    from requests.adapters import HTTPAdapter
+
+    class SourceAddressAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs["source_address"] = (source, 0)
+            super().init_poolmanager(*args, **kwargs)
+
+    return SourceAddressAdapter()
+
+
+@lru_cache(maxsize=None)
+def _aiohttp_socks():
+    """The optional aiohttp-socks package, or None."""
+    try:
+        import aiohttp_socks
+    except ImportError:
+        return None
+    return aiohttp_socks
+
+
+class Route:
+    def __init__(self, spec: str = ""):
+        self.spec = spec
+        self.proxy = spec if "://" in spec else None
+        self.source = spec if spec and not self.proxy else None
+        self.name = spec or "direct"
+        self.lock = Lock()
+        self.active = 0
+        self.failures = 0
+        self.healthy = True
+        self.bytes = 0
+        self.seconds = 0.0
+        self.rate = 0.0
+
+    @property
+    def scheme(self) -> str:
+        return urlparse(self.proxy).scheme if self.proxy else ""
+
+    def apply(self, session):
+        """Send a requests (or cloudscraper) session through this route.
+
+        socks proxies need PySocks (requests[socks]).
+        """
+        if self.proxy:
+            session.proxies.update({"http": self.proxy, "https": self.proxy})
+        elif self.source:
+            adapter = source_address_adapter(self.source)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+    def session(self):
+        import requests
+
+        return self.apply(requests.Session())
+
+    def ytdlp_args(self) -> list:
+        if self.proxy:
+            return ["--proxy", self.proxy]
+        if self.source:
+            return ["--source-address", self.source]
+        return []
+
+    def aiohttp_proxy(self):
+        """Per-request proxy for aiohttp; socks proxies go through aiohttp_connector instead."""
+        return self.proxy if self.scheme in ("http", "https") else None
+
+    @property
+    def aiohttp_ok(self) -> bool:
+        """aiohttp speaks http(s) proxies itself and socks only with aiohttp-socks installed."""
+        return not self.proxy or self.aiohttp_proxy() is not None or _aiohttp_socks() is not None
+
+    def aiohttp_connector(self, **kwargs):
+        """A connector for an aiohttp ClientSession whose connections leave through this route."""
+        if self.proxy and not self.aiohttp_proxy():
+            return _aiohttp_socks().ProxyConnector.from_url(self.proxy, **kwargs)
+        import aiohttp
+
+        return aiohttp.TCPConnector(local_addr=(self.source, 0) if self.source else None, **kwargs)
+
+    def record(self, nbytes: int, seconds: float) -> None:
+        with self.lock:
+            self.bytes += nbytes
+            self.seconds += seconds
+            if nbytes:
+                self.failures = 0
+            if seconds > 0:
+                rate = nbytes / seconds
+                self.rate = rate if not self.rate else (1 - RATE_ALPHA) * self.rate + RATE_ALPHA * rate
+
+    def failed(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.failures >= MAX_FAILURES and self.healthy:
+                self.healthy = False
+                log.warning(f"route {self.name} marked down after {self.failures} failures")
+
+    def describe(self) -> str:
+        state = "up" if self.healthy else "down"
+        return (f"{self.name}: {state}, {self.active} active, "
+                f"{self.rate / 1024 / 1024:.1f} MB/s, {self.bytes / 1024 / 1024:.0f}MB total")
+
+
+class RoutePool:
+    """Spreads outbound connections over several egress routes.
+
+    Hosts throttle per IP, so each new connection goes to the healthy route
+    with the fewest active connections; ties go to an untried route, then
+    the faster one. Hosts in STICKY_HOSTS are pinned to one route for as
+    long as it stays healthy.
+    """
+
+    def __init__(self, specs: list = None):
+        self.lock = Lock()
+        self.sticky = {}
+        self.monitor = None
+        self.monitor_pid = None
+        self.configure(specs or [])
+
+    def configure(self, specs: list) -> None:
+        routes = [Route(s.strip()) for s in specs if s.strip()]
+        with self.lock:
+            self.routes = routes or [Route()]
+            self.sticky.clear()
+        if len(self.routes) > 1 or self.routes[0].spec:
+            self.start_monitor()
+
+    def _candidates(self, aiohttp: bool = False) -> list:
+        routes = self.routes
+        if aiohttp:
+            routes = [r for r in routes if r.aiohttp_ok]
+            if not routes:
+                # Going direct instead would leak the host's own address
+                log.warning("no egress route usable from aiohttp; install aiohttp-socks for socks proxies")
+                raise NoRoute("no egress route usable from aiohttp")
+        healthy = [r for r in routes if r.healthy]
+        # With every route down, keep trying rather than failing the job outright
+        return healthy or routes
+
+    def pick(self, url: str, aiohttp: bool = False) -> Route:
+        host = host_key(url)
+        with self.lock:
+            if self.monitor_pid not in (None, os.getpid()):
+                # Forked child: the parent's health thread did not come along
+                self.start_monitor()
+            candidates = self._candidates(aiohttp)
+            sticky = any(pattern in host for pattern in STICKY_HOSTS)
+            if sticky:
+                route = self.sticky.get(host)
+                if route in candidates:
+                    return route
+            # Untried routes go first so every route gets measured
+            route = min(candidates, key=lambda r: (r.active, r.bytes > 0, -r.rate))
+            if sticky:
+                self.sticky[host] = route
+            return route
+
+    @contextmanager
+    def use(self, url: str, aiohttp: bool = False):
+        """Pick a route and count it as busy while the block runs."""
+        route = self.pick(url, aiohttp)
+        with route.lock:
+            route.active += 1
+        try:
+            yield route
+        finally:
+            with route.lock:
+                route.active -= 1
+
+    def check(self, route: Route) -> bool:
+        import requests
+
+        try:
+            with route.session() as s:
+                r = s.get(HEALTH_URL, timeout=10)
+            ok = r.status_code < 500
+        except requests.RequestException:
+            ok = False
+        with route.lock:
+            if ok and not route.healthy:
+                log.info(f"route {route.name} is back up")
+            route.healthy = ok
+            if ok:
+                route.failures = 0
+        return ok
+
+    def _monitor_loop(self) -> None:
+        while True:
+            for route in list(self.routes):
+                self.check(route)
+            time.sleep(HEALTH_INTERVAL)
+
+    def start_monitor(self) -> None:
+        """Start the health thread once per process."""
+        if self.monitor is None or self.monitor_pid != os.getpid():
+            self.monitor_pid = os.getpid()
+            self.monitor = Thread(target=self._monitor_loop, daemon=True)
+            self.monitor.start()
+
+    def describe(self) -> str:
+        return "\n".join(r.describe() for r in self.routes)
+
+
+pool = RoutePool(EGRESS_ROUTES.split(","))
@@ -0,0 +1,239 @@
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+import egress
+import spool
+from integrity import StreamHasher, record
+
+# --- Optional: Pillow for re-encoding oversized images ---
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+log = logging.getLogger("IMAGES")
+
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", "32"))
+IMAGE_REENCODE = os.getenv("IMAGE_REENCODE", "1") == "1"
+IMAGE_RETRIES = 3
+
+# Telegram rejects photos above 10MB or with width + height above 10000
+PHOTO_MAX_SIZE = 10 * 1024 * 1024
+PHOTO_MAX_DIMENSION = 10000
+PHOTO_FORMATS = ("JPEG", "PNG")
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'image/avif,image/webp,image/*,*/*;q=0.8',
+}
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: the bot process already runs pyrogram and background threads
+        _pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 2, mp_context=multiprocessing.get_context("spawn")
+        )
+        atexit.register(_pool.shutdown, cancel_futures=True)
+    return _pool
+
+
+class ImageFetcher:
+    """Downloads many small files over a shared pool of keep-alive connections."""
+
+    def __init__(self, concurrency: int = IMAGE_CONCURRENCY):
+        self.concurrency = concurrency
+        self.sem = asyncio.Semaphore(concurrency)
+        # One pooled session per egress route
+        self.sessions = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        for session in self.sessions.values():
+            await session.close()
+
+    def _session(self, route) -> aiohttp.ClientSession:
+        if route.name not in self.sessions:
+            self.sessions[route.name] = aiohttp.ClientSession(
+                connector=route.aiohttp_connector(limit=self.concurrency, ttl_dns_cache=300),
+                headers=HEADERS,
+                timeout=aiohttp.ClientTimeout(total=120, sock_read=30)
+            )
+        return self.sessions[route.name]
+
+    @asynccontextmanager
+    async def _get(self, url: str, headers: dict = None):
+        """GET url through an egress route that counts as busy until the body has been read."""
+        with egress.pool.use(url, aiohttp=True) as route:
+            started = time.monotonic()
+            try:
+                async with self._session(route).get(url, headers=headers, proxy=route.aiohttp_proxy()) as r:
+                    yield r
+                    route.record(r.content.total_bytes, time.monotonic() - started)
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+                route.failed()
+                raise
+
+    async def fetch(self, url: str, dest, referer: str = None) -> bool:
+        headers = {"Referer": referer} if referer else None
+        async with self.sem:
+            for attempt in range(1, IMAGE_RETRIES + 1):
+                try:
+                    async with self._get(url, headers) as r:
+                        r.raise_for_status()
+                        with open(dest, "wb") as f:
+                            async for chunk in r.content.iter_chunked(64 * 1024):
+                                f.write(chunk)
+                    return True
+                except aiohttp.ClientResponseError as e:
+                    log.warning(f"Image fetch failed ({attempt}/{IMAGE_RETRIES}) {url}: {e.status}")
+                    if e.status < 500 and e.status != 429:
+                        break
+                    await asyncio.sleep(attempt)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    log.warning(f"Image fetch failed ({attempt}/{IMAGE_RETRIES}) {url}: {e}")
+                    await asyncio.sleep(attempt)
+                except egress.NoRoute:
+                    break
+        if os.path.exists(dest):
+            os.remove(dest)
+        return False
+
+    async def fetch_spooled(self, url: str, dest, referer: str = None):
+        """Fetch a small item straight into RAM.
+
+        Returns a MemorySpool, a path if the body outgrew the spool and was
+        finished on disk, or None if the caller should use its usual download path.
+        """
+        headers = {"Referer": referer} if referer else None
+        async with self.sem:
+            try:
+                async with self._get(url, headers) as r:
+                    r.raise_for_status()
+                    if r.content_type.startswith("text/"):
+                        return None
+                    buf = spool.open_spool(os.path.basename(str(dest)), r.content_length or 0)
+                    if buf is None:
+                        return None
+                    hasher = StreamHasher()
+                    try:
+                        chunks = r.content.iter_chunked(64 * 1024)
+                        async for chunk in chunks:
+                            try:
+                                buf.write(chunk)
+                                hasher.update(chunk)
+                            except spool.SpoolOverflow:
+                                # Unknown size turned out too large: keep what we have and finish on disk
+                                buf.spill(dest)
+                                with open(dest, "ab") as f:
+                                    f.write(chunk)
+                                    async for rest in chunks:
+                                        f.write(rest)
+                                return str(dest)
+                    except BaseException:
+                        if not buf.closed:
+                            buf.release()
+                        raise
+                    if r.content_length and hasher.size != r.content_length:
+                        log.warning(f"Truncated spool for {url}")
+                        buf.release()
+                        return None
+                    record(os.path.basename(str(dest)), hasher, url)
+                    buf.shrink()
+                    buf.seek(0)
+                    return buf
+            except (aiohttp.ClientError, asyncio.TimeoutError, egress.NoRoute) as e:
+                log.warning(f"Spooled fetch failed {url}: {e}")
+                if os.path.exists(dest):
+                    os.remove(dest)
+                return None
+
+    async def fetch_photo(self, url: str, dest, referer: str = None):
+        """Fetch an image and make it sendable as a photo.
+
+        Returns a MemorySpool for small images, otherwise the final path, or None.
+        """
+        if spool.SPOOL_ENABLED:
+            item = await self.fetch_spooled(url, dest, referer)
+            if spool.is_spooled(item):
+                if photo_fits(item):
+                    return item
+                item = item.spill(dest)
+            if item is not None:
+                return await prepare_photo(item)
+        if not await self.fetch(url, dest, referer):
+            return None
+        return await prepare_photo(str(dest))
+
+
+def photo_fits(buf) -> bool:
+    """Cheap header-only check that a spooled image can be sent as a photo as-is."""
+    if buf.getbuffer().nbytes > PHOTO_MAX_SIZE:
+        return False
+    if Image is None:
+        return True
+    try:
+        with Image.open(buf) as img:
+            w, h = img.size
+            return w + h <= PHOTO_MAX_DIMENSION and img.format in PHOTO_FORMATS
+    except Exception:
+        return False
+    finally:
+        buf.seek(0)
+
+
+def normalize_photo(path: str) -> str:
+    """Re-encode an image Telegram would refuse as a photo. Runs in a worker process."""
+    with Image.open(path) as img:
+        w, h = img.size
+        fits = (
+            os.path.getsize(path) <= PHOTO_MAX_SIZE
+            and w + h <= PHOTO_MAX_DIMENSION
+            and img.format in PHOTO_FORMATS
+        )
+        if fits:
+            return path
+
+        if w + h > PHOTO_MAX_DIMENSION:
+            scale = PHOTO_MAX_DIMENSION / (w + h)
+            img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        dst = os.path.splitext(path)[0] + ".jpg"
+        if dst == path:
+            dst = os.path.splitext(path)[0] + ".reencoded.jpg"
+        quality = 90
+        while True:
+            img.save(dst, "JPEG", quality=quality, optimize=True)
+            if os.path.getsize(dst) <= PHOTO_MAX_SIZE or quality <= 50:
+                break
+            quality -= 10
+
+    os.remove(path)
+    return dst
+
+
+async def prepare_photo(path: str) -> str:
+    """Return a path Telegram will accept as a photo, re-encoding off the event loop if needed."""
+    if not IMAGE_REENCODE or Image is None:
+        return path
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), normalize_photo, path)
+    except Exception as e:
+        log.error(f"Image re-encode failed for {os.path.basename(path)}: {e}")
+        return path
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from threading import Lock
+
+log = logging.getLogger("INTEGRITY")
+
+DIGEST_LEDGER = os.getenv("DIGEST_LEDGER", "digests.jsonl")
+
+_ledger_lock = Lock()
+
+
+class IntegrityError(Exception):
+    pass
+
+
+class StreamHasher:
+    """Hashes bytes as they are written, so verification never re-reads a file."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.md5 = hashlib.md5()
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def update(self, chunk: bytes) -> None:
+        self.md5.update(chunk)
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+
+    def verify(self, expected_size: int = None, expected_md5: str = None) -> None:
+        if expected_size is not None and self.size != expected_size:
+            raise IntegrityError(f"size mismatch: got {self.size}, expected {expected_size}")
+        if expected_md5 and self.md5.hexdigest() != expected_md5.lower():
+            raise IntegrityError(f"md5 mismatch: got {self.md5.hexdigest()}, expected {expected_md5}")
+
+    def digests(self) -> dict:
+        return {"size": self.size, "md5": self.md5.hexdigest(), "sha256": self.sha256.hexdigest()}
+
+
+def record(name: str, hasher: StreamHasher, source: str = None) -> None:
+    """Append the digests of a verified transfer to the ledger."""
+    entry = {"name": name, "source": source, "time": int(time.time()), **hasher.digests()}
+    with _ledger_lock:
+        try:
+            with open(DIGEST_LEDGER, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            log.warning(f"cannot record digest for {name}: {e}")
+
+
+def lookup(md5: str = None, sha256: str = None):
+    """Return the most recent ledger entry matching either digest, or None."""
+    found = None
+    with _ledger_lock:
+        try:
+            with open(DIGEST_LEDGER) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if (md5 and entry.get("md5") == md5) or (sha256 and entry.get("sha256") == sha256):
+                        found = entry
+        except OSError:
+            pass
+    return found
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from scheduler import PRIORITY_CLASSES, UNKNOWN_SIZE
+
+# Must be on a local disk: the coordinator and workers share it through SQLite locking
+QUEUE_DB = os.getenv("QUEUE_DB", "jobs.sqlite")
+# A running job whose worker has not heartbeated for this long is handed to another worker
+LEASE_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    priority TEXT NOT NULL DEFAULT 'normal',
+    size INTEGER,
+    state TEXT NOT NULL DEFAULT 'queued',
+    chat_id INTEGER,
+    status_message_id INTEGER,
+    worker TEXT,
+    lease_until REAL,
+    progress TEXT,
+    progress_at REAL DEFAULT 0,
+    rendered_at REAL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL
+)
+"""
+
+
+class JobQueue:
+    """Job queue shared by the coordinator and its workers through one SQLite file.
+
+    All processes must run on the same host. WAL mode keeps the coordinator's
+    reads from blocking the workers, but it relies on shared memory, and
+    SQLite locking in general is unreliable over network filesystems, so
+    workers on other hosts are not supported. It stands in for a real broker.
+    """
+
+    def __init__(self, path: str = QUEUE_DB):
+        self.path = path
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @contextmanager
+    def _db(self):
+        db = self._connect()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def enqueue(self, url: str, priority: str = "normal", size: int = None,
+                chat_id: int = None, status_message_id: int = None) -> int:
+        with self._db() as db:
+            cur = db.execute(
+                "INSERT INTO jobs (url, priority, size, chat_id, status_message_id, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, priority, size, chat_id, status_message_id, time.time())
+            )
+            return cur.lastrowid
+
+    def claim(self, worker: str):
+        """Atomically take the best queued job (or one with an expired lease)."""
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                """
+                SELECT * FROM jobs
+                WHERE state = 'queued' OR (state = 'running' AND lease_until < ?)
+                ORDER BY CASE priority WHEN 'high' THEN 0 WHEN 'bulk' THEN 2 ELSE 1 END,
+                         COALESCE(size, ?), id
+                LIMIT 1
+                """,
+                (now, UNKNOWN_SIZE)
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE jobs SET state = 'running', worker = ?, lease_until = ? WHERE id = ?",
+                (worker, now + LEASE_SECONDS, row["id"])
+            )
+            db.execute("COMMIT")
+            return dict(row)
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def set_size(self, job_id: int, size: int, priority: str) -> None:
+        """Record a size estimate that arrived after the job was enqueued."""
+        with self._db() as db:
+            db.execute("UPDATE jobs SET size = ?, priority = ? WHERE id = ?", (size, priority, job_id))
+
+    def heartbeat(self, job_id: int, worker: str) -> str:
+        """Extend the lease and return the job's state, so the worker sees /cancel and /pause."""
+        with self._db() as db:
+            db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'running'",
+                (time.time() + LEASE_SECONDS, job_id, worker)
+            )
+            row = db.execute("SELECT state, worker FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return "cancelled"
+        if row["state"] in ("cancelled", "paused"):
+            return row["state"]
+        if row["state"] == "running" and row["worker"] == worker:
+            return "running"
+        # Taken over after our lease expired, or paused and resumed between two
+        # heartbeats: either way the job is no longer ours to run
+        return "lost"
+
+    def report(self, job_id: int, text: str) -> None:
+        with self._db() as db:
+            db.execute("UPDATE jobs SET progress = ?, progress_at = ? WHERE id = ?", (text, time.time(), job_id))
+
+    def finish(self, job_id: int, worker: str, state: str, error: str = None) -> None:
+        with self._db() as db:
+            db.execute(
+                "UPDATE jobs SET state = ?, error = ?, lease_until = NULL WHERE id = ? AND worker = ? AND state = 'running'",
+                (state, error, job_id, worker)
+            )
+
+    def set_state(self, job_id: int, state: str, allowed: tuple) -> bool:
+        marks = ",".join("?" * len(allowed))
+        with self._db() as db:
+            cur = db.execute(
+                f"UPDATE jobs SET state = ? WHERE id = ? AND state IN ({marks})",
+                (state, job_id, *allowed)
+            )
+            return cur.rowcount > 0
+
+    def cancel(self, job_id: int) -> bool:
+        return self.set_state(job_id, "cancelled", ("queued", "running", "paused"))
+
+    def pause(self, job_id: int) -> bool:
+        return self.set_state(job_id, "paused", ("queued", "running"))
+
+    def resume(self, job_id: int) -> bool:
+        return self.set_state(job_id, "queued", ("paused",))
+
+    def pending_progress(self) -> list:
+        """Jobs whose latest progress has not been rendered by the coordinator yet."""
+        with self._db() as db:
+            rows = db.execute("SELECT * FROM jobs WHERE progress_at > rendered_at").fetchall()
+        return [dict(r) for r in rows]
+
+    def mark_rendered(self, job_id: int, at: float) -> None:
+        with self._db() as db:
+            db.execute("UPDATE jobs SET rendered_at = ? WHERE id = ?", (at, job_id))
+
+    def active(self) -> list:
+        with self._db() as db:
+            rows = db.execute(
+                "SELECT * FROM jobs WHERE state IN ('queued', 'running', 'paused') ORDER BY id"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def position(self, job_id: int) -> int:
+        with self._db() as db:
+            row = db.execute("SELECT priority, size FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return 0
+            rank = PRIORITY_CLASSES.get(row["priority"], 1)
+            size = row["size"] or UNKNOWN_SIZE
+            ahead = 0
+            for other in db.execute("SELECT id, priority, size FROM jobs WHERE state = 'queued' AND id != ?", (job_id,)):
+                key = (PRIORITY_CLASSES.get(other["priority"], 1), other["size"] or UNKNOWN_SIZE, other["id"])
+                if key < (rank, size, job_id):
+                    ahead += 1
+        return ahead + 1
@@ -1,31 +1,36 @@
+import time
+_IMPORT_START = time.perf_counter()
+
+import io
 import os
 import re
 import math
 import asyncio
 import shutil
-import time
 import logging
-import subprocess
-import requests
+import mimetypes
+import socket
+import threading
+import multiprocessing
 from pathlib import Path
 
-from pyrogram import Client, filters, errors
+from pyrogram import Client, filters, errors, idle, raw
 from pyrogram.types import Message
 
-# --- Import Bunkr ---
-try:
-    from bunkr import Bunkr
-except ImportError:
-    Bunkr = None
-    print("Warning: bunkr.py not found. Bunkr logic will fail.")
-
-# --- Import Run (GoFile) ---
-try:
-    from run import GoFile, Downloader, File
-except ImportError:
-    GoFile = None
-    Downloader = None
-    print("Warning: run.py not found. GoFile logic will fail.")
+import egress
+import jobqueue
+import mediapool
+import providers
+import scheduler
+import spool
+
+# --- Host handlers are imported lazily on first use ---
+# bunkr pulls in cloudscraper/BeautifulSoup, run pulls in requests/tqdm/pathvalidate.
+providers.register("bunkr", "bunkr")
+providers.register("gofile", "run")
+providers.register("requests", "requests")
+providers.register("images", "images")
+providers.register("relay", "relay")
 
 API_ID = int(os.getenv("API_ID", "0"))
 API_HASH = os.getenv("API_HASH", "")
@@ -34,15 +39,56 @@ SESSION_STRING = os.getenv("SESSION_STRING", "")
 DOWNLOAD_DIR = Path("output")
 MAX_CHUNK_SIZE = 1900 * 1024 * 1024
 MIN_FREE_SPACE_MB = 500
+SPLIT_TIMEOUT = 3600
+
+# Album delivery: items are downloaded concurrently and sent as media groups
+ALBUM_MODE = os.getenv("ALBUM_MODE", "1") == "1"
+ALBUM_CONCURRENCY = int(os.getenv("ALBUM_CONCURRENCY", "6"))
+ALBUM_PREFETCH_GROUPS = int(os.getenv("ALBUM_PREFETCH_GROUPS", "4"))
+ALBUM_HOSTS = ("bunkr", "imgchest", "erome", "cyberdrop", "cyberfile")
+MEDIA_GROUP_SIZE = 10
+PHOTO_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+VIDEO_EXTS = ('.mp4', '.mkv', '.mov', '.m4v', '.webm')
+
+# Relay mode: files with a known size under MAX_CHUNK_SIZE are streamed from
+# the source straight into the Telegram upload without touching DOWNLOAD_DIR
+RELAY_MODE = os.getenv("RELAY_MODE", "1") == "1"
+# Relayed videos carry no duration, dimensions or thumbnail and skip the faststart
+# remux, so by default they take the disk path; set to 1 to trade that for speed
+RELAY_VIDEOS = os.getenv("RELAY_VIDEOS", "0") == "1"
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("BOT")
 
+PREWARM_PROVIDERS = os.getenv("PREWARM_PROVIDERS", "1") == "1"
+
+# Job scheduling: priority class first, then shortest job first
+SCHEDULER_SLOTS = int(os.getenv("SCHEDULER_SLOTS", "2"))
+BULK_JOB_SIZE = 10 * 1024 * 1024 * 1024
+# Size estimates only order the queue, so they are cut short rather than delay it
+ESTIMATE_TIMEOUT = 10
+jobs = None
+# asyncio only keeps weak references to tasks; in-flight size estimates live here
+estimate_tasks = set()
+
+# Distributed mode: a "coordinator" only takes requests and renders progress,
+# "worker" processes claim jobs from the shared queue (jobqueue.QUEUE_DB) and run them.
+# The queue is a local SQLite file, so this scales out to several worker processes
+# on the coordinator's machine only, not across machines.
+BOT_ROLE = os.getenv("BOT_ROLE", "standalone")
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_POLL_INTERVAL = 2
+HEARTBEAT_INTERVAL = 10
+job_queue = None
+
 app = Client(
     "gofile-userbot",
     api_id=API_ID,
     api_hash=API_HASH,
-    session_string=SESSION_STRING
+    session_string=SESSION_STRING,
+    # Workers only upload; the coordinator is the one that answers messages
+    no_updates=BOT_ROLE == "worker"
 )
 
 saved_messages_chat = None
@@ -102,11 +148,16 @@ async def progress_bar(current, total, status, title):
             f"<b>🚀 Sᴘᴇᴇᴅ:</b> {format_bytes(speed)}/s\n"
             f"<b>⏳ Eᴛᴀ:</b> {int(eta)}s"
         )
-    except:
+    except Exception:
         pass
 
+def job_dir():
+    """Work directory of the current job, so concurrent jobs never touch each other's files."""
+    job = scheduler.current_job.get()
+    return DOWNLOAD_DIR / f"job{job.id}" if job else DOWNLOAD_DIR
+
 # --- FAST FFPROBE ---
-def get_duration(file_path):
+async def get_duration(file_path, data=None):
     try:
         cmd = [
             "ffprobe", 
@@ -117,26 +168,25 @@ def get_duration(file_path):
             str(file_path)
         ]
         # Added timeout to prevent hanging
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=5)
-        if result.stdout.strip():
-            return float(result.stdout.strip())
+        # data is fed on stdin when file_path is "pipe:0" (in-memory spooled items)
+        result = await mediapool.run("cpu", cmd, timeout=5, input=data)
+        out = result.stdout.decode().strip()
+        if out:
+            return float(out)
     except Exception as e:
         log.error(f"Error getting duration: {e}")
     return 0
 
-def faststart_mp4(src):
+async def faststart_mp4(src):
     if not os.path.exists(src):
         return src
 
     dst = src + ".fast.mp4"
     try:
         # Added faststart to move atoms to beginning for streaming
-        result = subprocess.run(
-            ["ffmpeg", "-y", "-i", src, "-c", "copy", "-movflags", "+faststart", dst],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=300,
-            text=True
+        result = await mediapool.run(
+            "io", ["ffmpeg", "-y", "-i", src, "-c", "copy", "-movflags", "+faststart", dst],
+            timeout=300
         )
 
         if result.returncode == 0 and os.path.exists(dst):
@@ -147,7 +197,7 @@ def faststart_mp4(src):
         return src
 
 # --- FAST THUMBNAIL GENERATOR ---
-def generate_thumbnail(video_path):
+async def generate_thumbnail(video_path):
     video_path = str(video_path)
     thumb_path = f"{video_path}.jpg"
 
@@ -170,7 +220,7 @@ def generate_thumbnail(video_path):
                 thumb_path
             ]
             
-            subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
+            await mediapool.run("cpu", cmd, timeout=10)
 
             # Check if generated and valid size > 1KB
             if os.path.exists(thumb_path) and os.path.getsize(thumb_path) > 1000:
@@ -182,34 +232,101 @@ def generate_thumbnail(video_path):
     log.error(f"Failed to generate thumbnail for {os.path.basename(video_path)}")
     return None
 
+async def generate_thumbnail_from_bytes(data):
+    """Thumbnail for an in-memory clip: ffmpeg reads stdin and writes the JPEG to stdout."""
+    try:
+        cmd = [
+            "ffmpeg", "-i", "pipe:0",
+            "-vframes", "1", "-vf", "scale=320:-1", "-q:v", "2",
+            "-f", "image2", "pipe:1"
+        ]
+        result = await mediapool.run("cpu", cmd, timeout=10, input=data)
+        if result.returncode == 0 and len(result.stdout) > 1000:
+            thumb = io.BytesIO(result.stdout)
+            thumb.name = "thumb.jpg"
+            return thumb
+    except Exception as e:
+        log.error(f"Error generating in-memory thumbnail: {e}")
+    return None
+
+async def load_provider(name, attr=None):
+    """Import a host handler off the event loop the first time it is needed."""
+    return await asyncio.to_thread(providers.get, name, attr)
+
+async def iterate_in_thread(gen_func, *args, **kwargs):
+    """Run a blocking generator in a thread and yield its items as soon as they are produced."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    end = object()
+
+    def produce():
+        try:
+            for item in gen_func(*args, **kwargs):
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (end, e))
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, (end, None))
+
+    producer = asyncio.create_task(asyncio.to_thread(produce))
+    try:
+        while True:
+            item, error = await queue.get()
+            if error:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        # The consumer stopped early: let the scrape wind down at its next item
+        stop.set()
+        producer.cancel()
+
+async def prepend(head, rest):
+    """Yield the already-read items, then the rest of an async iterator."""
+    for item in head:
+        yield item
+    async for item in rest:
+        yield item
+
 # --- GOFILE LOGIC ---
 async def handle_gofile_logic(client, message, status, url):
     try:
-        if not GoFile:
+        gofile = await load_provider("gofile")
+        if not gofile:
             await status.edit("run.py is missing!")
             return
 
-        go = GoFile()
+        go = gofile.GoFile()
         m = re.search(r"gofile\.io/d/([\w\-]+)", url)
         if not m:
             await status.edit("Invalid GoFile URL.")
             return
 
-        DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
-        files = go.get_files(dir=str(DOWNLOAD_DIR), content_id=m.group(1))
-        if not files:
-            await status.edit("No files found in GoFile link.")
-            return
+        work_dir = job_dir()
+        work_dir.mkdir(parents=True, exist_ok=True)
+        await status.edit("Listing GoFile folder...")
 
-        await status.edit(f"Found {len(files)} file(s) on GoFile. Processing...")
-
-        for idx, file in enumerate(files, 1):
+        # Files are processed as the folder walk finds them
+        idx = 0
+        async for file in iterate_in_thread(go.iter_files, str(work_dir), content_id=m.group(1)):
+            idx += 1
             if get_free_space() < MIN_FREE_SPACE_MB * 1024 * 1024:
                 await status.edit("Disk Full.")
                 break
 
             file_name = os.path.basename(file.dest)
-            await status.edit(f"[{idx}/{len(files)}] Preparing: {file_name}...")
+            await status.edit(f"[{idx}] Preparing: {file_name}...")
+
+            if RELAY_MODE and await relay_file(
+                client, status, file.link, file_name,
+                headers={"Cookie": f"accountToken={go.token}"},
+                label=f"[{idx}]", expected_md5=file.md5
+            ):
+                continue
 
             dest_dir = os.path.dirname(file.dest)
             if dest_dir:
@@ -224,10 +341,12 @@ async def handle_gofile_logic(client, message, status, url):
 
             async def download_task():
                 try:
-                    await asyncio.to_thread(
-                        Downloader(token=go.token).download,
-                        file, 1, on_part_ready
+                    job = scheduler.current_job.get()
+                    # No remux here: upload_task runs faststart_mp4 through the media pool
+                    downloader = gofile.Downloader(
+                        token=go.token, cancel_event=job.cancel_event if job else None, remux=False
                     )
+                    await asyncio.to_thread(downloader.download, file, 1, on_part_ready)
                 except Exception as e:
                     log.error(f"Download error: {e}")
                 finally:
@@ -249,10 +368,10 @@ async def handle_gofile_logic(client, message, status, url):
                                 continue
 
                             caption = f"{file_name} [Part {part_num}/{total_parts}]" if total_parts > 1 else file_name
-                            await status.edit(f"[{idx}/{len(files)}] Uploading Part {part_num}/{total_parts}...")
+                            await status.edit(f"[{idx}] Uploading Part {part_num}/{total_parts}...")
 
-                            fixed_path = await asyncio.to_thread(faststart_mp4, str(path))
-                            thumb_path = await asyncio.to_thread(generate_thumbnail, fixed_path)
+                            fixed_path = await faststart_mp4(str(path))
+                            thumb_path = await generate_thumbnail(fixed_path)
 
                             try:
                                 chat_id = await get_saved_messages_chat(client)
@@ -281,18 +400,21 @@ async def handle_gofile_logic(client, message, status, url):
                                 break
 
                     except asyncio.CancelledError:
-                        break
+                        raise
                     except Exception as e:
                         log.error(f"Upload loop error: {e}")
 
             await asyncio.gather(download_task(), upload_task())
 
+        if not idx:
+            await status.edit("No files found in GoFile link.")
+            return
         await status.edit("GoFile Download Complete!")
     except Exception as e:
         log.exception(e)
         await status.edit(f"GoFile Error: {str(e)}")
 
-async def download_direct_any(url, out_path, status):
+async def download_direct_any(url, out_path, status, referer=None):
     out_path = Path(out_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
@@ -304,14 +426,37 @@ async def download_direct_any(url, out_path, status):
         "--newline",
         "--no-check-certificate", 
         "-o", str(out_path),
-        url
     ]
+    if referer:
+        cmd.extend(["--referer", referer])
+
+    with egress.pool.use(url) as route:
+        cmd.extend(route.ytdlp_args())
+        cmd.append(url)
+        # Its own process group, so cancelling also kills the ffmpeg merge it spawns
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        scheduler.track_process(process)
+        started = time.monotonic()
+        try:
+            ok = await _follow_ytdlp(process, out_path, status)
+            # yt-dlp carries most generic and album traffic, so it feeds the route stats too
+            if ok:
+                route.record(out_path.stat().st_size, time.monotonic() - started)
+            else:
+                route.failed()
+            return ok
+        except asyncio.CancelledError:
+            scheduler.kill_process(process)
+            raise
+        finally:
+            scheduler.untrack_process(process)
 
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
+async def _follow_ytdlp(process, out_path, status):
 
     pattern = re.compile(r'\[download\]\s+(\d+\.?\d*)%\s+of\s+(?:~)?(\d+\.?\d+)(\w+)\s+at\s+([^\s]+)\s+ETA\s+([^\s]+)')
     last_update = 0
@@ -324,7 +469,7 @@ async def download_direct_any(url, out_path, status):
         try:
             line_decoded = line.decode().strip()
             match = pattern.search(line_decoded)
-            if match:
+            if match and status:
                 now = time.time()
                 if now - last_update > 3:
                     percent = float(match.group(1))
@@ -341,7 +486,7 @@ async def download_direct_any(url, out_path, status):
                         f"<b>🚀 Sᴘᴇᴇᴅ:</b> {speed} | <b>⏳ ETA:</b> {eta}"
                     )
                     last_update = now
-        except:
+        except Exception:
             pass
 
     await process.wait()
@@ -350,62 +495,182 @@ async def download_direct_any(url, out_path, status):
 # --- BUNKR LOGIC HELPERS ---
 
 async def resolve_bunkr_url(url):
-    """Uses bunkr.py to scrape the album/file and return a list of direct links."""
-    if not Bunkr: return []
+    """Uses bunkr.py to scrape the album/file, yielding direct links as they are decrypted."""
+    Bunkr = await load_provider("bunkr", "Bunkr")
+    if not Bunkr: return
     try:
-        b = Bunkr()
+        # Sticky hosts keep the route their Cloudflare clearance was earned on
+        b = Bunkr(route=egress.pool.pick(url))
         # Run the scraping in a thread to not block the bot
-        items = await asyncio.to_thread(b.get_files, url)
-        resolved = []
-        for item in items:
-            resolved.append({
+        async for item in iterate_in_thread(b.iter_files, url):
+            yield {
                 "url": item["url"],
                 "name": item.get("name", "bunkr_video.mp4"),
                 "size": 0
-            })
-        return resolved
+            }
     except Exception as e:
         log.error(f"Bunkr Resolve Error: {e}")
-        return []
 
 async def resolve_generic_url(url):
-    items = []
     if "pixeldrain.com" in url:
+        requests = await load_provider("requests")
+        if not requests: return
         if "/l/" in url:
             lid = url.split("/l/")[1].split("/")[0]
             try:
-                r = requests.get(f"https://pixeldrain.com/api/list/{lid}").json()
-                if r.get("success"):
-                    for f in r.get("files", []):
-                        items.append({"url": f"https://pixeldrain.com/api/file/{f['id']}", "name": f['name'], "size": f['size']})
-            except: pass
+                r = (await asyncio.to_thread(requests.get, f"https://pixeldrain.com/api/list/{lid}")).json()
+            except Exception: return
+            if r.get("success"):
+                for f in r.get("files", []):
+                    yield {"url": f"https://pixeldrain.com/api/file/{f['id']}", "name": f['name'], "size": f['size']}
         elif "/u/" in url:
             fid = url.split("/u/")[1].split("/")[0]
             try:
-                r = requests.get(f"https://pixeldrain.com/api/file/{fid}/info").json()
-                items.append({"url": f"https://pixeldrain.com/api/file/{fid}", "name": r.get('name', f'{fid}.mp4'), "size": r.get('size', 0)})
-            except: pass
+                r = (await asyncio.to_thread(requests.get, f"https://pixeldrain.com/api/file/{fid}/info")).json()
+            except Exception: return
+            yield {"url": f"https://pixeldrain.com/api/file/{fid}", "name": r.get('name', f'{fid}.mp4'), "size": r.get('size', 0)}
     else:
-        items.append({"url": url, "name": "video.mp4", "size": 0})
-    return items
+        yield {"url": url, "name": "video.mp4", "size": 0}
 
-async def handle_generic_logic(client, message, status, url, file_list=None):
-    if file_list is None:
-        file_list = await resolve_generic_url(url)
-        
-    if not file_list:
-        await status.edit("No files found.")
+async def upload_large_file(client, status, path, name, label=""):
+    """Split a file above MAX_CHUNK_SIZE into uploadable parts and send them in order."""
+    size = os.path.getsize(path)
+    duration = await get_duration(str(path))
+    base_str = str(path.with_suffix(""))
+
+    if duration > 0:
+        SAFE_TARGET = 1850 * 1024 * 1024
+        segment_time = int((SAFE_TARGET / size) * duration)
+        if segment_time < 30: segment_time = 30
+
+        cmd = [
+            "ffmpeg", "-i", str(path), "-c", "copy", "-map", "0",
+            "-f", "segment", "-segment_time", str(segment_time),
+            "-reset_timestamps", "1", f"{base_str}.part%03d.mp4"
+        ]
+    else:
+        await status.edit("Metadata error. Using binary split.")
+        cmd = [
+            "split", "-b", "1900M", "--numeric-suffixes=0",
+            "--additional-suffix=.mp4", str(path), f"{base_str}.part"
+        ]
+
+    try:
+        await mediapool.run("io", cmd, timeout=SPLIT_TIMEOUT)
+    except mediapool.MediaTimeout as e:
+        log.error(f"Split failed: {e}")
+
+    if path.exists(): os.remove(path)
+
+    parts = sorted(path.parent.glob(f"{path.stem}.part*.mp4"))
+    if not parts:
+        await status.edit("Splitting produced no output files.")
+        return
+
+    for i, part in enumerate(parts, 1):
+        part_name = f"{name} [Part {i}/{len(parts)}]"
+        await status.edit(f"{label}Uploading Part {i}/{len(parts)}...")
+
+        thumb = await generate_thumbnail(str(part))
+        try:
+            chat_id = await get_saved_messages_chat(client)
+            await client.send_video(
+                chat_id,
+                str(part),
+                caption=part_name,
+                thumb=thumb,
+                supports_streaming=True,
+                progress=progress_bar,
+                progress_args=(status, f"UP: {i}/{len(parts)}")
+            )
+        except Exception as e:
+            log.error(f"Upload error part {i}: {e}")
+            await asyncio.sleep(5)
+
+        if thumb and os.path.exists(thumb): os.remove(thumb)
+        if part.exists(): os.remove(part)
+
+async def relay_file(client, status, url, name, headers=None, label="", expected_md5=None):
+    """Relay a file from its source to Saved Messages without writing it to disk.
+
+    Returns False when the source is not eligible or the relay broke, so the
+    caller can fall back to the regular download path.
+    """
+    if name.lower().endswith(VIDEO_EXTS) and not RELAY_VIDEOS:
+        return False
+    relay = await load_provider("relay")
+    if not relay:
+        return False
+    try:
+        file = await relay.relay_upload(
+            client, url, name, headers=headers, max_size=MAX_CHUNK_SIZE, expected_md5=expected_md5,
+            progress=progress_bar, progress_args=(status, f"RELAY: {label} {name}")
+        )
+        if file is None:
+            return False
+
+        mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        attributes = [raw.types.DocumentAttributeFilename(file_name=name)]
+        if name.lower().endswith(VIDEO_EXTS):
+            attributes.insert(0, raw.types.DocumentAttributeVideo(duration=0, w=0, h=0, supports_streaming=True))
+        chat_id = await get_saved_messages_chat(client)
+        await client.invoke(raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=raw.types.InputMediaUploadedDocument(file=file, mime_type=mime, attributes=attributes),
+            message=name,
+            random_id=client.rnd_id()
+        ), sleep_threshold=60)
+        return True
+    except Exception as e:
+        log.error(f"Relay failed for {name}, falling back to disk: {e}")
+        return False
+
+async def send_single_image(client, status, item, path, name):
+    images = await load_provider("images")
+    photo = None
+    if images:
+        async with images.ImageFetcher(concurrency=1) as fetcher:
+            photo = await fetcher.fetch_photo(item["url"], path, item.get("referer"))
+    if not photo:
+        await status.edit("Download failed.")
         return
 
-    total = len(file_list)
-    for idx, item in enumerate(file_list, 1):
+    try:
+        chat_id = await get_saved_messages_chat(client)
+        if spool.item_size(photo) <= PHOTO_MAX_SIZE:
+            await client.send_photo(chat_id, photo, caption=name)
+        else:
+            await client.send_document(chat_id, photo, caption=name)
+    except Exception as e:
+        log.error(f"Upload error: {e}")
+
+    spool.discard(photo)
+
+async def handle_generic_logic(client, message, status, url, items=None):
+    """Download and upload items one by one as the resolver (an async iterator) yields them."""
+    if items is None:
+        items = resolve_generic_url(url)
+
+    idx = 0
+    async for item in items:
+        idx += 1
         name = re.sub(r'[^\w\-. ]', '', item["name"])
         if not name: name = "video.mp4"
-        path = DOWNLOAD_DIR / name
+        path = job_dir() / name
         path.parent.mkdir(parents=True, exist_ok=True)
 
-        await status.edit(f"<b>⬇️ [{idx}/{total}] Dᴏᴡɴʟᴏᴀᴅɪɴɢ: {name}...</b>")
-        ok = await download_direct_any(item["url"], path, status)
+        await status.edit(f"<b>⬇️ [{idx}] Dᴏᴡɴʟᴏᴀᴅɪɴɢ: {name}...</b>")
+        if name.lower().endswith(IMAGE_EXTS):
+            await send_single_image(client, status, item, path, name)
+            continue
+
+        # Sources that report their size up front (pixeldrain) can skip the disk entirely
+        if RELAY_MODE and 0 < item.get("size", 0) <= MAX_CHUNK_SIZE:
+            headers = {"Referer": item["referer"]} if item.get("referer") else None
+            if await relay_file(client, status, item["url"], name, headers=headers, label=f"[{idx}]"):
+                continue
+
+        ok = await download_direct_any(item["url"], path, status, item.get("referer"))
 
         if not ok or not path.exists():
             await status.edit("Download failed.")
@@ -415,7 +680,7 @@ async def handle_generic_logic(client, message, status, url, file_list=None):
 
         if size <= MAX_CHUNK_SIZE:
             # Generate thumbnail using the FAST method
-            thumb = await asyncio.to_thread(generate_thumbnail, str(path))
+            thumb = await generate_thumbnail(str(path))
             try:
                 chat_id = await get_saved_messages_chat(client)
                 await client.send_video(
@@ -434,99 +699,540 @@ async def handle_generic_logic(client, message, status, url, file_list=None):
             if path.exists(): os.remove(path)
             continue
 
-        await status.edit(f"[{idx}/{total}] File > 1.9GB. Splitting...")
-
-        duration = await asyncio.to_thread(get_duration, str(path))
-        base_str = str(path.with_suffix(""))
+        await status.edit(f"[{idx}] File > 1.9GB. Splitting...")
+        await upload_large_file(client, status, path, name, f"[{idx}] ")
 
-        if duration > 0:
-            SAFE_TARGET = 1850 * 1024 * 1024
-            segment_time = int((SAFE_TARGET / size) * duration)
-            if segment_time < 30: segment_time = 30
+    if not idx:
+        await status.edit("No files found.")
+        return
+    await status.edit("<b>✅ Tᴀsᴋ Cᴏᴍᴘʟᴇᴛᴇᴅ!</b>")
 
-            cmd = [
-                "ffmpeg", "-i", str(path), "-c", "copy", "-map", "0",
-                "-f", "segment", "-segment_time", str(segment_time),
-                "-reset_timestamps", "1", f"{base_str}.part%03d.mp4"
-            ]
+# --- ALBUM LOGIC (MEDIA GROUPS) ---
+def classify_album_item(name, size):
+    lower = name.lower()
+    if size > MAX_CHUNK_SIZE:
+        return "large"
+    if lower.endswith(IMAGE_EXTS) and size <= PHOTO_MAX_SIZE:
+        return "photo"
+    if lower.endswith(VIDEO_EXTS):
+        return "video"
+    return "document"
+
+async def download_album_item(item, idx, sem, fetcher=None):
+    name = re.sub(r'[^\w\-. ]', '', item["name"]) or f"item_{idx}.mp4"
+    # Prefix with the index so concurrent downloads never collide on a name
+    path = job_dir() / f"{idx:04d}_{name}"
+    source = None
+    if fetcher and name.lower().endswith(IMAGE_EXTS):
+        # Images skip yt-dlp and ffmpeg entirely and share the pooled HTTP session
+        source = await fetcher.fetch_photo(item["url"], path, item.get("referer"))
+        if isinstance(source, str) and source != str(path):
+            name = Path(name).with_suffix(Path(source).suffix).name
+    elif fetcher and spool.SPOOL_ENABLED:
+        # Small clips and files go straight into RAM; anything else falls back to yt-dlp
+        source = await fetcher.fetch_spooled(item["url"], path, item.get("referer"))
+    if source is None and not name.lower().endswith(IMAGE_EXTS):
+        async with sem:
+            if await download_direct_any(item["url"], path, None, item.get("referer")):
+                source = str(path)
+    if source is None or not (spool.is_spooled(source) or os.path.exists(source)):
+        log.error(f"Album item failed: {name}")
+        return None
+    if not spool.is_spooled(source):
+        source = Path(source)
+    size = spool.item_size(source)
+    return {"path": source, "name": name, "size": size, "kind": classify_album_item(name, size)}
+
+async def upload_album_media(client, peer, entry):
+    """Upload one album member and return it as a ready-to-send raw InputMedia."""
+    source = entry["path"]
+    if not spool.is_spooled(source):
+        source = str(source)
+    kind = entry["kind"]
+    file = await client.save_file(source)
+    if file is None:
+        raise RuntimeError("upload failed")
+
+    if kind == "photo":
+        media = raw.types.InputMediaUploadedPhoto(file=file)
+    elif kind == "video":
+        if spool.is_spooled(source):
+            data = source.getvalue()
+            thumb = await generate_thumbnail_from_bytes(data)
+            duration = await get_duration("pipe:0", data)
         else:
-            await status.edit("Metadata error. Using binary split.")
-            cmd = [
-                "split", "-b", "1900M", "--numeric-suffixes=0",
-                "--additional-suffix=.mp4", str(path), f"{base_str}.part"
+            thumb = await generate_thumbnail(source)
+            duration = await get_duration(source)
+        entry["thumb"] = thumb
+        media = raw.types.InputMediaUploadedDocument(
+            file=file,
+            mime_type=mimetypes.guess_type(entry["name"])[0] or "video/mp4",
+            thumb=await client.save_file(thumb) if thumb else None,
+            attributes=[
+                raw.types.DocumentAttributeVideo(duration=int(duration), w=0, h=0, supports_streaming=True),
+                raw.types.DocumentAttributeFilename(file_name=entry["name"])
             ]
+        )
+    else:
+        media = raw.types.InputMediaUploadedDocument(
+            file=file,
+            mime_type=mimetypes.guess_type(entry["name"])[0] or "application/octet-stream",
+            force_file=True,
+            attributes=[raw.types.DocumentAttributeFilename(file_name=entry["name"])]
+        )
 
-        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        await proc.wait()
-
-        if path.exists(): os.remove(path)
-
-        parts = sorted(path.parent.glob(f"{path.stem}.part*.mp4"))
-        if not parts:
-            await status.edit("Splitting produced no output files.")
-            continue
-
-        for i, part in enumerate(parts, 1):
-            part_name = f"{name} [Part {i}/{len(parts)}]"
-            await status.edit(f"[{idx}/{total}] Uploading Part {i}/{len(parts)}...")
+    uploaded = await client.invoke(raw.functions.messages.UploadMedia(peer=peer, media=media))
+    if kind == "photo":
+        p = uploaded.photo
+        return raw.types.InputMediaPhoto(
+            id=raw.types.InputPhoto(id=p.id, access_hash=p.access_hash, file_reference=p.file_reference)
+        )
+    d = uploaded.document
+    return raw.types.InputMediaDocument(
+        id=raw.types.InputDocument(id=d.id, access_hash=d.access_hash, file_reference=d.file_reference)
+    )
 
-            thumb = await asyncio.to_thread(generate_thumbnail, str(part))
+async def send_album_group(client, chat_id, entries, status, label):
+    """Upload all members of a group in parallel, then send them as one media group."""
+    await status.edit(f"<b>📤 {label} Uᴘʟᴏᴀᴅɪɴɢ {len(entries)} ɪᴛᴇᴍs...</b>")
+    peer = await client.resolve_peer(chat_id)
+    try:
+        results = await asyncio.gather(
+            *(upload_album_media(client, peer, e) for e in entries),
+            return_exceptions=True
+        )
+        multi_media = []
+        for entry, result in zip(entries, results):
+            if isinstance(result, Exception):
+                log.error(f"Album upload error ({entry['name']}): {result}")
+                continue
+            multi_media.append(raw.types.InputSingleMedia(
+                media=result, random_id=client.rnd_id(), message=entry["name"]
+            ))
+        if not multi_media:
+            return 0
+
+        for attempt in range(2):
             try:
-                chat_id = await get_saved_messages_chat(client)
-                await client.send_video(
-                    chat_id,
-                    str(part),
-                    caption=part_name,
-                    thumb=thumb,
-                    supports_streaming=True,
-                    progress=progress_bar,
-                    progress_args=(status, f"UP: {i}/{len(parts)}")
-                )
-            except Exception as e:
-                log.error(f"Upload error part {i}: {e}")
-                await asyncio.sleep(5)
+                if len(multi_media) == 1:
+                    single = multi_media[0]
+                    await client.invoke(raw.functions.messages.SendMedia(
+                        peer=peer, media=single.media, message=single.message, random_id=single.random_id
+                    ), sleep_threshold=60)
+                else:
+                    await client.invoke(raw.functions.messages.SendMultiMedia(
+                        peer=peer, multi_media=multi_media
+                    ), sleep_threshold=60)
+                return len(multi_media)
+            except errors.FloodWait as e:
+                if attempt:
+                    raise
+                log.warning(f"FloodWait {e.value}s while sending album group")
+                await asyncio.sleep(e.value)
+    except Exception as e:
+        log.error(f"Album group send error: {e}")
+        return 0
+    finally:
+        for entry in entries:
+            spool.discard(entry.get("thumb"))
+            spool.discard(entry["path"])
+
+async def handle_album_logic(client, message, status, items):
+    """Deliver an album as media groups. items is an async iterator, so the
+    first groups download and upload while the scrape is still running.
+    """
+    sem = asyncio.Semaphore(ALBUM_CONCURRENCY)
+    chat_id = await get_saved_messages_chat(client)
+    # Only keep a few groups downloading ahead of the uploader so disk use stays bounded
+    window = MEDIA_GROUP_SIZE * ALBUM_PREFETCH_GROUPS
+    pending = asyncio.Queue(window)
+    tasks = []
+    buckets = {"visual": [], "document": []}
+    sent = 0
+    groups = 0
+    total = 0
+
+    async def flush(bucket):
+        nonlocal sent, groups
+        groups += 1
+        sent += await send_album_group(client, chat_id, list(bucket), status, f"[Group {groups}]")
+        bucket.clear()
+
+    # Item names are not known up front, so the image fetcher is always set up
+    images = await load_provider("images")
+    fetcher = images.ImageFetcher() if images else None
+
+    async def feed():
+        count = 0
+        try:
+            async for item in items:
+                count += 1
+                task = asyncio.create_task(download_album_item(item, count, sem, fetcher))
+                tasks.append(task)
+                # Blocks while the prefetch window is full
+                await pending.put(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f"Album resolve error: {e}")
+        await pending.put(None)
 
-            if thumb and os.path.exists(thumb): os.remove(thumb)
-            if part.exists(): os.remove(part)
+    await status.edit("<b>⬇️ Dᴏᴡɴʟᴏᴀᴅɪɴɢ ᴀʟʙᴜᴍ...</b>")
+    if fetcher:
+        await fetcher.__aenter__()
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            task = await pending.get()
+            if task is None:
+                break
+            total += 1
+            entry = await task
+            if entry is None:
+                continue
+
+            if entry["kind"] == "large":
+                await status.edit(f"[{total}] File > 1.9GB. Splitting...")
+                await upload_large_file(client, status, entry["path"], entry["name"], f"[{total}] ")
+                sent += 1
+                continue
+
+            # Telegram only lets documents share a group with other documents
+            bucket = buckets["document" if entry["kind"] == "document" else "visual"]
+            bucket.append(entry)
+            if len(bucket) == MEDIA_GROUP_SIZE:
+                await flush(bucket)
+
+        for bucket in buckets.values():
+            if bucket:
+                await flush(bucket)
+    finally:
+        feeder.cancel()
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(feeder, *tasks, return_exceptions=True)
+        if fetcher:
+            await fetcher.__aexit__(None, None, None)
+        # After a cancel or error, free whatever was downloaded but never sent;
+        # discard is a no-op for entries send_album_group already cleaned up
+        leftovers = [entry for bucket in buckets.values() for entry in bucket]
+        for task in tasks:
+            if not task.cancelled() and task.exception() is None and task.result():
+                leftovers.append(task.result())
+        for entry in leftovers:
+            spool.discard(entry.get("thumb"))
+            spool.discard(entry["path"])
+
+    await status.edit(f"<b>✅ Aʟʙᴜᴍ Dᴇʟɪᴠᴇʀᴇᴅ: {sent}/{total} ɪᴛᴇᴍs</b>")
+
+async def probe_size(url):
+    if "gofile.io" in url:
+        gofile = await load_provider("gofile")
+        m = re.search(r"gofile\.io/d/([\w\-]+)", url)
+        if gofile and m:
+            # Top-level files only: walking a deep tree costs one API call per folder
+            return await asyncio.to_thread(gofile.GoFile().get_total_size, m.group(1), None, False) or None
+    elif "pixeldrain.com" in url:
+        return sum([item["size"] async for item in resolve_generic_url(url)]) or None
+    elif not any(host in url for host in ALBUM_HOSTS):
+        requests = await load_provider("requests")
+        if requests:
+            r = await asyncio.to_thread(requests.head, url, allow_redirects=True, timeout=ESTIMATE_TIMEOUT)
+            size = int(r.headers.get("Content-Length", 0))
+            # A small body is usually an HTML page that yt-dlp will resolve
+            return size if size > 1024 * 1024 else None
+    return None
 
-    await status.edit("<b>✅ Tᴀsᴋ Cᴏᴍᴘʟᴇᴛᴇᴅ!</b>")
+async def estimate_size(url):
+    """Best-effort total size of a link for shortest-job-first ordering; None when unknown."""
+    try:
+        return await asyncio.wait_for(probe_size(url), ESTIMATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        log.info(f"Size estimate for {url} took over {ESTIMATE_TIMEOUT}s, queueing it as unknown")
+    except Exception as e:
+        log.warning(f"Size estimate failed for {url}: {e}")
+    return None
 
-@app.on_message(filters.text & (filters.outgoing | filters.private))
-async def handler(client, message: Message):
-    text = message.text.strip()
-    if not text.startswith("http"): return
+def queued_text(job_id, priority, size, position):
+    size_text = format_bytes(size) if size else "size unknown"
+    return (
+        f"<b>⏳ Qᴜᴇᴜᴇᴅ ᴀs ᴊᴏʙ #{job_id}</b> ({priority}, {size_text})\n"
+        f"Position {position} · /cancel {job_id} · /pause {job_id}"
+    )
 
-    status = await message.reply("<b>🔍 Aɴᴀʟʏsɪɴɢ Lɪɴᴋ...</b>")
+async def refine_job(job_id, url, status, priority_given):
+    """Estimate a queued job's size in the background and re-sort it once known."""
+    size = await estimate_size(url)
+    if not size:
+        return
+    priority = None if priority_given else ("bulk" if size >= BULK_JOB_SIZE else "normal")
+    if job_queue:
+        row = next((r for r in await asyncio.to_thread(job_queue.active) if r["id"] == job_id), None)
+        if row is None:
+            return
+        priority = priority or row["priority"]
+        await asyncio.to_thread(job_queue.set_size, job_id, size, priority)
+        if row["state"] != "queued":
+            return
+        position = await asyncio.to_thread(job_queue.position, job_id)
+    else:
+        job = jobs.jobs.get(job_id)
+        if job is None:
+            return
+        jobs.resize(job, size, priority)
+        if job.state != "queued":
+            return
+        priority, position = job.priority, jobs.position(job)
+    try:
+        await status.edit(queued_text(job_id, priority, size, position))
+    except Exception:
+        pass
 
-    shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
-    DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+async def run_job(job):
+    client = app
+    status = job.status
+    text = job.url
+    work_dir = job_dir()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    work_dir.mkdir(parents=True, exist_ok=True)
 
     try:
         if "gofile.io" in text:
-            await handle_gofile_logic(client, message, status, text)
+            await handle_gofile_logic(client, job.message, status, text)
         
-        elif "bunkr" in text:
-            if not Bunkr:
+        elif any(host in text for host in ALBUM_HOSTS):
+            if not await load_provider("bunkr"):
                 await status.edit("Bunkr module not available.")
             else:
-                await status.edit("<b>🔄 Sᴄʀᴀᴘɪɴɢ Bᴜɴᴋʀ...</b>")
-                files = await resolve_bunkr_url(text)
-                if files:
-                    await handle_generic_logic(client, message, status, text, file_list=files)
-                else:
+                await status.edit("<b>🔄 Sᴄʀᴀᴘɪɴɢ Aʟʙᴜᴍ...</b>")
+                items = resolve_bunkr_url(text)
+                # Two items are enough to tell an album from a single file; the rest keeps streaming
+                head = []
+                async for item in items:
+                    head.append(item)
+                    if len(head) == 2:
+                        break
+                if not head:
                     await status.edit("No files found on Bunkr.")
+                elif ALBUM_MODE and len(head) > 1:
+                    await handle_album_logic(client, job.message, status, prepend(head, items))
+                else:
+                    await handle_generic_logic(client, job.message, status, text, items=prepend(head, items))
 
         else:
-            await handle_generic_logic(client, message, status, text)
-            
+            await handle_generic_logic(client, job.message, status, text)
+
+    except asyncio.CancelledError:
+        verb = "Pᴀᴜsᴇᴅ" if job.state == "paused" else "Cᴀɴᴄᴇʟʟᴇᴅ"
+        try:
+            await status.edit(f"<b>⏹ Jᴏʙ #{job.id} {verb}</b>")
+        except Exception:
+            pass
+        raise
     except Exception as e:
         log.error(e)
         await status.edit(f"Error: {e}")
     finally:
+        # Frees the job's disk usage, including after /cancel or /pause
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+@app.on_message(filters.command(["cancel", "pause", "resume", "jobs"]) & (filters.outgoing | filters.private))
+async def job_commands(client, message: Message):
+    command = message.command[0].lower()
+    arg = message.command[1] if len(message.command) > 1 else None
+    job_id = int(arg.lstrip("#")) if arg and arg.lstrip("#").isdigit() else None
+
+    if job_queue:
+        await queue_command(message, command, job_id)
+    elif command == "jobs":
+        active = jobs.active()
+        lines = [j.describe() for j in sorted(active, key=lambda j: j.sort_key())]
+        header = "⏸ Queue paused\n" if jobs.paused else ""
+        body = "\n".join(lines) if lines else "No active jobs."
+        await message.reply(
+            f"{header}{body}\n\n{mediapool.pool.describe()}\n{egress.pool.describe()}", parse_mode=None
+        )
+    elif command == "cancel":
+        if job_id is None:
+            await message.reply("Usage: /cancel <job>")
+        elif jobs.cancel(job_id):
+            await message.reply(f"Job #{job_id} cancelled.")
+        else:
+            await message.reply(f"Job #{job_id} is not active.")
+    elif command == "pause":
+        if job_id is None:
+            jobs.pause()
+            await message.reply("Queue paused. Running jobs continue; /pause <job> stops one.")
+        elif jobs.pause_job(job_id):
+            await message.reply(f"Job #{job_id} paused. /resume {job_id} to requeue it.")
+        else:
+            await message.reply(f"Job #{job_id} is not active.")
+    elif command == "resume":
+        if job_id is None:
+            jobs.resume()
+            await message.reply("Queue resumed.")
+        elif jobs.resume_job(job_id):
+            await message.reply(f"Job #{job_id} requeued.")
+        else:
+            await message.reply(f"Job #{job_id} is not paused.")
+
+async def queue_command(message, command, job_id):
+    """/jobs, /cancel, /pause and /resume against the shared queue; workers pick the change up on heartbeat."""
+    if command == "jobs":
+        rows = await asyncio.to_thread(job_queue.active)
+        lines = [f"#{r['id']} [{r['priority']}] {r['state']} {r['worker'] or ''} {r['url'][:60]}" for r in rows]
+        await message.reply("\n".join(lines) if lines else "No active jobs.", parse_mode=None)
+    elif job_id is None:
+        await message.reply(f"Usage: /{command} <job>")
+    else:
+        action = {"cancel": job_queue.cancel, "pause": job_queue.pause, "resume": job_queue.resume}[command]
+        ok = await asyncio.to_thread(action, job_id)
+        await message.reply(f"Job #{job_id}: {command} {'ok' if ok else 'not applicable'}.")
+
+async def render_queue_progress():
+    """Coordinator loop: mirror progress reported by workers into the users' status messages."""
+    while True:
+        await asyncio.sleep(WORKER_POLL_INTERVAL)
+        try:
+            rows = await asyncio.to_thread(job_queue.pending_progress)
+            for row in rows:
+                try:
+                    await app.edit_message_text(row["chat_id"], row["status_message_id"], row["progress"])
+                except errors.MessageNotModified:
+                    pass
+                except Exception as e:
+                    log.warning(f"Cannot render progress of job {row['id']}: {e}")
+                await asyncio.to_thread(job_queue.mark_rendered, row["id"], row["progress_at"])
+        except Exception as e:
+            log.error(f"Progress render loop error: {e}")
+
+class RemoteStatus:
+    """Stands in for the status Message inside a worker: edits are reported to the coordinator."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+
+    async def edit(self, text, *args, **kwargs):
+        await asyncio.to_thread(self.queue.report, self.job_id, text)
+
+async def worker_main():
+    queue = jobqueue.JobQueue()
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    local = scheduler.Scheduler(run_job, slots=SCHEDULER_SLOTS, disk_path=str(DOWNLOAD_DIR))
+    local.start()
+    await app.start()
+    log.info(f"Worker {worker_id} ready")
+
+    claimed = {}
+    last_heartbeat = 0
+    try:
+        while True:
+            # Report finished jobs back to the queue
+            for job_id, job in list(claimed.items()):
+                if job.state in ("done", "failed") or (job.state in ("cancelled", "paused") and job not in local.running):
+                    if job.state in ("done", "failed"):
+                        await asyncio.to_thread(queue.finish, job_id, worker_id, job.state)
+                    del claimed[job_id]
+                    # A resumed job is claimed again as a new Job, so a paused one is never needed here
+                    local.discard(job)
+
+            # Pick up /cancel and /pause from the coordinator and keep leases alive
+            now = time.time()
+            if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                last_heartbeat = now
+                for job_id, job in list(claimed.items()):
+                    state = await asyncio.to_thread(queue.heartbeat, job_id, worker_id)
+                    if state == "paused":
+                        local.pause_job(job_id)
+                    elif state in ("cancelled", "lost"):
+                        local.cancel(job_id)
+
+            if len(claimed) < local.slots:
+                row = await asyncio.to_thread(queue.claim, worker_id)
+                if row:
+                    log.info(f"Worker {worker_id} claimed job {row['id']}")
+                    job = local.submit(
+                        row["url"], row["priority"], row["size"],
+                        status=RemoteStatus(queue, row["id"]), job_id=row["id"]
+                    )
+                    claimed[job.id] = job
+                    continue
+
+            await asyncio.sleep(WORKER_POLL_INTERVAL)
+    finally:
+        await app.stop()
+
+def run_worker_process():
+    app.run(worker_main())
+
+@app.on_message(filters.text & (filters.outgoing | filters.private))
+async def handler(client, message: Message):
+    text = message.text.strip()
+    # Optional priority class prefix: "high <url>" / "bulk <url>"
+    priority = None
+    parts = text.split(maxsplit=1)
+    if len(parts) == 2 and parts[0].lower() in scheduler.PRIORITY_CLASSES:
+        priority, text = parts[0].lower(), parts[1].strip()
+    if not text.startswith("http"): return
+
+    status = await message.reply("<b>🔍 Aɴᴀʟʏsɪɴɢ Lɪɴᴋ...</b>")
+
+    # Queue right away; the size estimate re-sorts the job once it arrives
+    priority_given = priority is not None
+    priority = priority or "normal"
+    if job_queue:
+        job_id = await asyncio.to_thread(job_queue.enqueue, text, priority, None, status.chat.id, status.id)
+        position = await asyncio.to_thread(job_queue.position, job_id)
+    else:
+        job = jobs.submit(text, priority, None, message=message, status=status)
+        job_id, position = job.id, jobs.position(job)
+    await status.edit(queued_text(job_id, priority, None, position))
+    task = asyncio.create_task(refine_job(job_id, text, status, priority_given))
+    estimate_tasks.add(task)
+    task.add_done_callback(estimate_tasks.discard)
+
+IMPORT_TIME = time.perf_counter() - _IMPORT_START
+
+async def main():
+    log.info(f"Startup imports took {IMPORT_TIME * 1000:.0f}ms")
+    global jobs, job_queue
+    if BOT_ROLE == "coordinator":
+        job_queue = jobqueue.JobQueue()
+    else:
         shutil.rmtree(DOWNLOAD_DIR, ignore_errors=True)
+        DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        jobs = scheduler.Scheduler(
+            run_job, slots=SCHEDULER_SLOTS, disk_path=str(DOWNLOAD_DIR),
+            min_free=MIN_FREE_SPACE_MB * 1024 * 1024
+        )
+        jobs.start()
+    await app.start()
+    log.info(f"Connected {time.perf_counter() - _IMPORT_START:.2f}s after start")
+    if job_queue:
+        asyncio.create_task(render_queue_progress())
+    if PREWARM_PROVIDERS:
+        providers.prewarm()
+    await idle()
+    await app.stop()
 
 if __name__ == "__main__":
     if not API_ID or not API_HASH or not SESSION_STRING:
         print("Error: API_ID, API_HASH, and SESSION_STRING environment variables are required.")
+    elif BOT_ROLE == "worker":
+        # Several workers on one host share DOWNLOAD_DIR; each job works in its own job<id> dir
+        DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        if WORKER_PROCESSES > 1:
+            # Spawned, not forked: each worker starts its own background threads
+            # (egress health checks, credential refresh) instead of inheriting dead ones
+            ctx = multiprocessing.get_context("spawn")
+            procs = [ctx.Process(target=run_worker_process) for _ in range(WORKER_PROCESSES)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+        else:
+            run_worker_process()
     else:
-        app.run()
+        app.run(main())
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+import subprocess
+import time
+
+import scheduler
+
+log = logging.getLogger("MEDIA")
+
+# Remuxes and splits stream whole files through the disk; probes and thumbnails
+# read a few MB and are mostly CPU, so they get their own, wider, limit
+MEDIA_IO_WORKERS = int(os.getenv("MEDIA_IO_WORKERS", "2"))
+MEDIA_CPU_WORKERS = int(os.getenv("MEDIA_CPU_WORKERS", str(os.cpu_count() or 2)))
+
+
+class MediaTimeout(Exception):
+    pass
+
+
+class MediaPool:
+    """Bounded pool for ffmpeg/ffprobe (and split) child processes.
+
+    Tasks are either "io" or "cpu" and each kind has its own concurrency
+    limit. A task that exceeds its timeout, or whose job is cancelled, has
+    its child killed before the call returns.
+    """
+
+    def __init__(self, io_workers: int = MEDIA_IO_WORKERS, cpu_workers: int = MEDIA_CPU_WORKERS):
+        self.limits = {"io": asyncio.Semaphore(io_workers), "cpu": asyncio.Semaphore(cpu_workers)}
+        self.metrics = {
+            kind: {"queued": 0, "running": 0, "done": 0, "failed": 0, "timeouts": 0, "cancelled": 0,
+                   "wait": 0.0, "busy": 0.0}
+            for kind in self.limits
+        }
+
+    async def run(self, kind: str, cmd: list, timeout: float, input: bytes = None) -> subprocess.CompletedProcess:
+        """Run cmd once a slot of the given kind is free. Raises MediaTimeout after timeout seconds of running."""
+        stats = self.metrics[kind]
+        stats["queued"] += 1
+        queued_at = time.monotonic()
+        try:
+            await self.limits[kind].acquire()
+        finally:
+            stats["queued"] -= 1
+        started = time.monotonic()
+        stats["wait"] += started - queued_at
+        stats["running"] += 1
+        try:
+            result = await self._execute(cmd, timeout, input)
+            stats["done"] += 1
+            return result
+        except MediaTimeout:
+            stats["timeouts"] += 1
+            raise
+        except asyncio.CancelledError:
+            stats["cancelled"] += 1
+            raise
+        except Exception:
+            stats["failed"] += 1
+            raise
+        finally:
+            stats["running"] -= 1
+            stats["busy"] += time.monotonic() - started
+            self.limits[kind].release()
+
+    async def _execute(self, cmd: list, timeout: float, input: bytes = None) -> subprocess.CompletedProcess:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        # Registered with the job, so /cancel kills it as well
+        scheduler.track_process(proc)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(input), timeout)
+        except asyncio.TimeoutError:
+            self._kill(proc)
+            await proc.wait()
+            raise MediaTimeout(f"{cmd[0]} timed out after {timeout}s")
+        except asyncio.CancelledError:
+            self._kill(proc)
+            raise
+        finally:
+            scheduler.untrack_process(proc)
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+    @staticmethod
+    def _kill(proc) -> None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+    def describe(self) -> str:
+        lines = []
+        for kind, stats in self.metrics.items():
+            # Every task that got a slot, however it ended
+            finished = stats["done"] + stats["failed"] + stats["timeouts"] + stats["cancelled"]
+            avg_wait = stats["wait"] / finished if finished else 0
+            lines.append(
+                f"media {kind}: {stats['running']} running, {stats['queued']} queued, "
+                f"{stats['done']} done, {stats['failed']} failed, {stats['timeouts']} timed out, "
+                f"{stats['cancelled']} cancelled, avg wait {avg_wait:.1f}s"
+            )
+        return "\n".join(lines)
+
+
+pool = MediaPool()
+
+
+async def run(kind: str, cmd: list, timeout: float, input: bytes = None) -> subprocess.CompletedProcess:
+    return await pool.run(kind, cmd, timeout, input)
@@ -0,0 +1,78 @@
+import importlib
+import logging
+import threading
+import time
+
+log = logging.getLogger("PROVIDERS")
+
+
+class Provider:
+    """A host handler module that is imported on first use."""
+
+    def __init__(self, name: str, module: str):
+        self.name = name
+        self.module_name = module
+        self.module = None
+        self.error = None
+        self.load_time = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.module is not None
+
+    def load(self):
+        if self.module is not None or self.error is not None:
+            return self.module
+        with self.lock:
+            if self.module is None and self.error is None:
+                start = time.perf_counter()
+                try:
+                    self.module = importlib.import_module(self.module_name)
+                except ImportError as e:
+                    self.error = e
+                    log.warning(f"Provider '{self.name}' unavailable: {e}")
+                self.load_time = time.perf_counter() - start
+                if self.module is not None:
+                    log.info(f"Provider '{self.name}' loaded in {self.load_time * 1000:.0f}ms")
+        return self.module
+
+
+_registry: dict[str, Provider] = {}
+
+
+def register(name: str, module: str) -> Provider:
+    if name not in _registry:
+        _registry[name] = Provider(name, module)
+    return _registry[name]
+
+
+def get(name: str, attr: str = None):
+    """Return the provider module (or one of its attributes), importing it on first use.
+
+    Returns None when the provider's module or any of its dependencies is missing.
+    """
+    provider = _registry[name]
+    module = provider.load()
+    if module is None:
+        return None
+    return getattr(module, attr) if attr else module
+
+
+def prewarm(names: list[str] = None) -> threading.Thread:
+    """Load providers in a daemon thread so the first request does not pay for it."""
+    targets = [_registry[n] for n in (names or list(_registry))]
+
+    def _run():
+        for provider in targets:
+            provider.load()
+        times = ", ".join(f"{name} {t * 1000:.0f}ms" for name, t in import_times().items())
+        log.info(f"Providers prewarmed: {times or 'none available'}")
+
+    thread = threading.Thread(target=_run, name="provider-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_times() -> dict[str, float]:
+    return {name: p.load_time for name, p in _registry.items() if p.loaded}
@@ -0,0 +1,175 @@
+import asyncio
+import collections
+import logging
+import math
+import os
+import time
+
+import aiohttp
+from pyrogram import raw
+from pyrogram.session import Session
+
+import egress
+from integrity import IntegrityError, StreamHasher, record
+
+log = logging.getLogger("RELAY")
+
+RELAY_BUFFER = int(os.getenv("RELAY_BUFFER_MB", "32")) * 1024 * 1024
+RELAY_UPLOAD_WORKERS = 4
+
+# Same part layout pyrogram's save_file uses
+PART_SIZE = 512 * 1024
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+
+class RingBuffer:
+    """Bounded byte queue between the HTTP reader and the Telegram part uploader."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.chunks = collections.deque()
+        self.size = 0
+        self.eof = False
+        self.error = None
+        self.cond = asyncio.Condition()
+
+    async def write(self, data: bytes) -> None:
+        async with self.cond:
+            # An empty buffer always accepts, so a chunk larger than capacity cannot stall
+            await self.cond.wait_for(lambda: self.size + len(data) <= self.capacity or not self.size)
+            self.chunks.append(data)
+            self.size += len(data)
+            self.cond.notify_all()
+
+    async def close(self, error: Exception = None) -> None:
+        async with self.cond:
+            self.eof = True
+            self.error = error
+            self.cond.notify_all()
+
+    async def read(self, n: int) -> bytes:
+        """Return exactly n bytes, or fewer only once the source has ended."""
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.size >= n or self.eof)
+            if self.error:
+                raise self.error
+            out = bytearray()
+            while self.chunks and len(out) < n:
+                chunk = self.chunks.popleft()
+                take = n - len(out)
+                if len(chunk) > take:
+                    self.chunks.appendleft(chunk[take:])
+                    chunk = chunk[:take]
+                out += chunk
+            self.size -= len(out)
+            self.cond.notify_all()
+            return bytes(out)
+
+
+async def _pump(response, ring: RingBuffer) -> None:
+    try:
+        async for chunk in response.content.iter_chunked(256 * 1024):
+            await ring.write(chunk)
+        await ring.close()
+    except Exception as e:
+        await ring.close(e)
+
+
+async def relay_upload(client, url: str, name: str, headers: dict = None, max_size: int = None,
+                       expected_md5: str = None, progress=None, progress_args: tuple = ()):
+    """Stream an HTTP source straight into a Telegram file upload.
+
+    Download and upload overlap through a bounded RingBuffer, so nothing is
+    written to disk. Returns an InputFile/InputFileBig, or None when the
+    source does not report a Content-Length (or exceeds max_size) and the
+    caller should use the disk path instead. Raises if the transfer breaks
+    or the bytes do not match Content-Length / expected_md5; verified
+    digests are recorded in the integrity ledger.
+    """
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+    started = time.monotonic()
+    with egress.pool.use(url, aiohttp=True) as route:
+        try:
+            connector = route.aiohttp_connector()
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+                async with http.get(url, headers=headers, proxy=route.aiohttp_proxy()) as r:
+                    r.raise_for_status()
+                    size = r.content_length
+                    if not size or (max_size and size > max_size):
+                        return None
+
+                    ring = RingBuffer(RELAY_BUFFER)
+                    is_big = size > BIG_FILE_SIZE
+                    total_parts = math.ceil(size / PART_SIZE)
+                    file_id = client.rnd_id()
+                    hasher = StreamHasher()
+                    errors = []
+                    queue = asyncio.Queue(RELAY_UPLOAD_WORKERS)
+
+                    session = Session(
+                        client, await client.storage.dc_id(), await client.storage.auth_key(),
+                        await client.storage.test_mode(), is_media=True
+                    )
+
+                    async def worker():
+                        while True:
+                            rpc = await queue.get()
+                            if rpc is None:
+                                return
+                            if errors:
+                                # Keep draining so the producer never blocks on a dead pool
+                                continue
+                            try:
+                                await session.invoke(rpc)
+                            except Exception as e:
+                                errors.append(e)
+
+                    await session.start()
+                    pump = asyncio.create_task(_pump(r, ring))
+                    workers = [asyncio.create_task(worker()) for _ in range(RELAY_UPLOAD_WORKERS)]
+                    try:
+                        sent = 0
+                        for part in range(total_parts):
+                            expected = min(PART_SIZE, size - sent)
+                            chunk = await ring.read(expected)
+                            if len(chunk) < expected:
+                                raise IntegrityError(f"source ended after {sent + len(chunk)} of {size} bytes")
+                            if errors:
+                                raise errors[0]
+                            hasher.update(chunk)
+
+                            if is_big:
+                                rpc = raw.functions.upload.SaveBigFilePart(
+                                    file_id=file_id, file_part=part, file_total_parts=total_parts, bytes=chunk
+                                )
+                            else:
+                                rpc = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=part, bytes=chunk)
+                            await queue.put(rpc)
+
+                            sent += len(chunk)
+                            if progress:
+                                await progress(sent, size, *progress_args)
+
+                        if await ring.read(1):
+                            raise IntegrityError(f"source is larger than its Content-Length ({size} bytes)")
+                        # Checked before the caller sends anything, so a bad transfer is never delivered
+                        hasher.verify(size, expected_md5)
+                    finally:
+                        for _ in workers:
+                            await queue.put(None)
+                        await asyncio.gather(*workers)
+                        pump.cancel()
+                        await session.stop()
+
+                    if errors:
+                        raise errors[0]
+                    record(name, hasher, url)
+                    route.record(size, time.monotonic() - started)
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+            # The source connection broke (the Telegram side raises its own errors)
+            route.failed()
+            raise
+
+    if is_big:
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=name)
+    return raw.types.InputFile(id=file_id, parts=total_parts, name=name, md5_checksum=hasher.md5.hexdigest())
@@ -1,17 +1,25 @@
 import argparse
 import fnmatch
 import hashlib
+import json
 import logging
 import math
 import os
+import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from threading import Condition, Lock, Thread, Event, local
 import subprocess
 import requests
 from pathvalidate import sanitize_filename
 import shutil
+import tempfile
 from tqdm import tqdm
 
+import egress
+from integrity import IntegrityError, StreamHasher, record
+from tuner import BLOCK_SIZE, get_tuner
+
 logging.basicConfig(
     level=logging.INFO,
     format="[%(asctime)s][%(funcName)20s()][%(levelname)-8s]: %(message)s",
@@ -19,46 +27,384 @@ logging.basicConfig(
 )
 logger = logging.getLogger("GoFile")
 
+CREDENTIALS_FILE = os.getenv("GOFILE_CREDENTIALS_FILE", ".gofile_credentials.json")
+TOKEN_TTL = int(os.getenv("GOFILE_TOKEN_TTL", str(24 * 3600)))
+WT_TTL = int(os.getenv("GOFILE_WT_TTL", str(6 * 3600)))
+# Refresh credentials this many seconds before they go stale
+REFRESH_MARGIN = 600
+AUTH_ERRORS = ("error-token", "error-auth", "error-notAuthorized", "error-wrongToken")
+# Timeout of GoFile API and credential calls
+API_TIMEOUT = 30
+# How many times a short range is resumed from where it stopped
+RANGE_RETRIES = 3
+THROTTLE_STATUSES = (429, 503)
+# A faststart remux copies streams, so anything slower than this is stuck
+REMUX_TIMEOUT = 600
+
 class File:
-    def __init__(self, link: str, dest: str):
+    def __init__(self, link: str, dest: str, md5: str = None):
         self.link = link
         self.dest = dest
+        self.md5 = md5
 
     def __str__(self):
         return f"{self.dest} ({self.link})"
 
+class Throttled(Exception):
+    pass
+
+class ServerError(Exception):
+    """A 5xx answer; like a dropped connection, the rest of the range is fetched again."""
+
+class DownloadCancelled(Exception):
+    pass
+
+class TokenRejected(Exception):
+    pass
+
+class AggregateProgress:
+    """One progress bar and throughput tally for files downloading in parallel."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.bar = tqdm(total=0, unit='B', unit_scale=True, desc='Downloading')
+        self.started = time.monotonic()
+        self.bytes = 0
+        self.done = 0
+        self.failed = 0
+
+    def file(self, size):
+        with self.lock:
+            self.bar.total += size
+            self.bar.refresh()
+        return FileProgress(self)
+
+    def finish(self, ok):
+        with self.lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            self.bar.set_postfix(files=self.done, failed=self.failed)
+
+    def close(self):
+        self.bar.close()
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (f"{self.done} file(s) downloaded, {self.failed} failed: "
+                f"{self.bytes / 1024 / 1024:.1f} MiB in {elapsed:.1f}s "
+                f"({self.bytes / 1024 / 1024 / elapsed:.2f} MiB/s)")
+
+class FileProgress:
+    """A single file's view of an AggregateProgress, with the tqdm calls Downloader makes."""
+
+    def __init__(self, aggregate):
+        self.aggregate = aggregate
+        self.n = 0
+
+    def update(self, n):
+        with self.aggregate.lock:
+            self.n += n
+            self.aggregate.bytes += n
+            self.aggregate.bar.update(n)
+
+    def reset(self):
+        # The file is fetched again: take back what it had counted
+        with self.aggregate.lock:
+            self.aggregate.bytes -= self.n
+            self.aggregate.bar.update(-self.n)
+            self.n = 0
+
+    def close(self):
+        pass
+
 class Downloader:
-    def __init__(self, token):
+    def __init__(self, token, autotune=True, cancel_event=None, progress=None, remux=True):
         self.token = token
+        self.autotune = autotune
+        self.cancel_event = cancel_event
+        # Callers that remux through their own media pool turn the faststart pass off
+        self.remux = remux
+        # Shared AggregateProgress when several downloads run side by side
+        self.shared_progress = progress
+        self.supports_range = False
         self.progress_lock = Lock()
         self.progress_bar = None
+        self._local = local()
+        self.token_lock = Lock()
+        self.token_refreshed = False
+
+    def _session(self, route):
+        # One keep-alive session per worker thread and egress route
+        if not hasattr(self._local, "sessions"):
+            self._local.sessions = {}
+        if route.name not in self._local.sessions:
+            self._local.sessions[route.name] = route.session()
+        return self._local.sessions[route.name]
+
+    def _check_auth(self, r, token):
+        if r.status_code in (401, 403):
+            raise TokenRejected(f"HTTP {r.status_code} with token {token[:6]}...")
+
+    def _refresh_token(self, rejected):
+        """Swap in a fresh account token after the file server rejected one.
+
+        Returns False when this download already refreshed once and the new
+        token was rejected too; parallel workers that hit the same rejection
+        just pick up the token another worker fetched.
+        """
+        with self.token_lock:
+            if self.token != rejected:
+                return True
+            if self.token_refreshed:
+                return False
+            go = GoFile()
+            if go.token in ("", rejected):
+                logger.warning("GoFile rejected the account token, refreshing")
+                go.invalidate()
+                go.update_token()
+            self.token = go.token
+            self.token_refreshed = True
+            return True
+
+    def _check_cancelled(self):
+        if self.cancel_event and self.cancel_event.is_set():
+            raise DownloadCancelled("download cancelled")
+
+    def _update_progress(self, n):
+        self._check_cancelled()
+        with self.progress_lock:
+            if self.progress_bar:
+                self.progress_bar.update(n)
 
     def _get_total_size(self, link):
-        r = requests.head(link, headers={"Cookie": f"accountToken={self.token}"})
+        route = egress.pool.pick(link)
+        for attempt in range(2):
+            token = self.token
+            r = self._session(route).head(link, headers={"Cookie": f"accountToken={token}"})
+            if attempt == 0 and r.status_code in (401, 403) and self._refresh_token(token):
+                continue
+            break
         r.raise_for_status()
-        return int(r.headers["Content-Length"]), r.headers.get("Accept-Ranges", "none") == "bytes"
+        self.supports_range = r.headers.get("Accept-Ranges", "none") == "bytes"
+        return int(r.headers["Content-Length"]), self.supports_range
 
     def _ensure_dir(self, filepath):
         dir_path = os.path.dirname(filepath)
         if dir_path:
             os.makedirs(dir_path, exist_ok=True)
 
-    def _download_range(self, link, start, end, temp_file, i):
+    def _download_range(self, link, start, end, temp_file, i, hasher=None):
+        """Download bytes start..end into temp_file, hashing them as they are written."""
+        if self.autotune and self.supports_range and end - start + 1 >= 2 * BLOCK_SIZE:
+            self._download_parallel(link, start, end, temp_file, hasher)
+            return i
+        return self._download_stream(link, start, end, temp_file, i, hasher)
+
+    def _download_stream(self, link, start, end, temp_file, i, hasher=None):
+        """Single-connection download. A transfer that stops short is resumed
+        from the last written byte instead of starting the range over.
+        """
         self._ensure_dir(temp_file)
-        headers = {
-            "Cookie": f"accountToken={self.token}",
-            "Range": f"bytes={start}-{end}"
-        }
-        with requests.get(link, headers=headers, stream=True) as r:
-            r.raise_for_status()
-            with open(temp_file, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        with self.progress_lock:
-                            if self.progress_bar:
-                                self.progress_bar.update(len(chunk))
-        return i
+        tuner = get_tuner(link)
+        expected = end - start + 1
+        written = 0
+        mode = "wb"
+        for attempt in range(RANGE_RETRIES + 1):
+            token = self.token
+            headers = {
+                "Cookie": f"accountToken={token}",
+                "Range": f"bytes={start + written}-{end}"
+            }
+            before = written
+            # Counts against the host's connection limit like the parallel blocks do
+            with tuner.slot(self._check_cancelled), egress.pool.use(link) as route:
+                started = time.monotonic()
+                try:
+                    with self._session(route).get(link, headers=headers, stream=True) as r:
+                        self._check_auth(r, token)
+                        if r.status_code >= 500:
+                            raise ServerError(f"HTTP {r.status_code}")
+                        r.raise_for_status()
+                        with open(temp_file, mode) as f:
+                            for chunk in r.iter_content(chunk_size=8192):
+                                if chunk:
+                                    if written + len(chunk) > expected:
+                                        raise IntegrityError(f"range {start}-{end} returned more than {expected} bytes")
+                                    f.write(chunk)
+                                    written += len(chunk)
+                                    if hasher:
+                                        hasher.update(chunk)
+                                    self._update_progress(len(chunk))
+                    route.record(written - before, time.monotonic() - started)
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                    route.failed()
+                    logger.warning(f"range {start}-{end} interrupted at {written}/{expected} via {route.name}: {e}")
+                except ServerError as e:
+                    logger.warning(f"range {start}-{end} got {e} at {written}/{expected}")
+                    time.sleep(2 ** attempt)
+                except TokenRejected:
+                    if not self._refresh_token(token):
+                        raise
+                    continue
+            if written == expected:
+                return i
+            # Nothing written yet means the file may not have been truncated
+            if written:
+                mode = "ab"
+            logger.warning(f"range {start}-{end} short by {expected - written} bytes, re-fetching the rest ({attempt + 1}/{RANGE_RETRIES})")
+        raise IntegrityError(f"range {start}-{end} incomplete: {written}/{expected} bytes")
+
+    def _fetch_block(self, link, bstart, bend, tuner, conn_id):
+        """Fetch one block into memory, resuming it if the connection drops."""
+        expected = bend - bstart + 1
+        buf = bytearray()
+        for attempt in range(RANGE_RETRIES + 1):
+            token = self.token
+            headers = {
+                "Cookie": f"accountToken={token}",
+                "Range": f"bytes={bstart + len(buf)}-{bend}"
+            }
+            received = 0
+            # The slot caps connections to the host across every running download;
+            # each block may leave through a different route, spreading per-IP limits
+            with tuner.slot(self._check_cancelled), egress.pool.use(link) as route:
+                started = time.monotonic()
+                try:
+                    with self._session(route).get(link, headers=headers, stream=True, timeout=(15, 60)) as r:
+                        if r.status_code in THROTTLE_STATUSES:
+                            tuner.on_throttle()
+                            raise Throttled(f"HTTP {r.status_code}")
+                        self._check_auth(r, token)
+                        if r.status_code >= 500:
+                            raise ServerError(f"HTTP {r.status_code}")
+                        r.raise_for_status()
+                        if r.status_code != 206:
+                            raise IntegrityError("server ignored the Range header")
+                        for chunk in r.iter_content(chunk_size=tuner.chunk_size):
+                            if chunk:
+                                buf += chunk
+                                received += len(chunk)
+                                self._update_progress(len(chunk))
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.Timeout) as e:
+                    route.failed()
+                    logger.warning(f"block {bstart}-{bend} interrupted at {len(buf)}/{expected} via {route.name}: {e}")
+                except Throttled:
+                    time.sleep(2 ** attempt)
+                except ServerError as e:
+                    logger.warning(f"block {bstart}-{bend} got {e} at {len(buf)}/{expected}")
+                    time.sleep(2 ** attempt)
+                except TokenRejected:
+                    if not self._refresh_token(token):
+                        raise
+                elapsed = time.monotonic() - started
+                tuner.record(conn_id, received, elapsed)
+                route.record(received, elapsed)
+            if len(buf) > expected:
+                raise IntegrityError(f"block {bstart}-{bend} returned more than {expected} bytes")
+            if len(buf) == expected:
+                return bytes(buf)
+        raise IntegrityError(f"block {bstart}-{bend} incomplete: {len(buf)}/{expected} bytes")
+
+    def _download_parallel(self, link, start, end, temp_file, hasher=None):
+        """Download start..end over a tuned number of ranged connections.
+
+        Blocks are handed out in order; the HostTuner grows or shrinks the
+        worker count while the transfer runs. Finished blocks are written at
+        their offset and fed to the hasher strictly in order, holding at most
+        a few blocks in memory while an earlier one is still in flight.
+        """
+        self._ensure_dir(temp_file)
+        tuner = get_tuner(link)
+        blocks = deque((b, min(b + BLOCK_SIZE - 1, end)) for b in range(start, end + 1, BLOCK_SIZE))
+        state = Condition()
+        pending = {}
+        errors = []
+        workers = {}
+        next_hash = [start]
+
+        with open(temp_file, "wb") as f:
+            f.truncate(end - start + 1)
+        fd = os.open(temp_file, os.O_WRONLY)
+
+        def worker(conn_id):
+            try:
+                while True:
+                    with state:
+                        # Stay within the reorder window so memory stays bounded
+                        state.wait_for(lambda: errors or not blocks or len(pending) < 2 * tuner.max_connections)
+                        if errors or not blocks:
+                            return
+                        if len(workers) > tuner.connections:
+                            # Scale down: this worker retires itself
+                            workers.pop(conn_id, None)
+                            return
+                        bstart, bend = blocks.popleft()
+                    data = self._fetch_block(link, bstart, bend, tuner, conn_id)
+                    os.pwrite(fd, data, bstart - start)
+                    with state:
+                        pending[bstart] = data
+                        while next_hash[0] in pending:
+                            chunk = pending.pop(next_hash[0])
+                            if hasher:
+                                hasher.update(chunk)
+                            next_hash[0] += len(chunk)
+                        state.notify_all()
+            except Exception as e:
+                with state:
+                    errors.append(e)
+                    state.notify_all()
+            finally:
+                with state:
+                    workers.pop(conn_id, None)
+                    state.notify_all()
+
+        conn_ids = iter(range(1 << 30))
+        try:
+            while True:
+                self._check_cancelled()
+                target = tuner.tick()
+                with state:
+                    if errors:
+                        raise errors[0]
+                    if not blocks and not workers:
+                        break
+                    while blocks and len(workers) < target:
+                        conn_id = next(conn_ids)
+                        t = Thread(target=worker, args=(conn_id,), daemon=True)
+                        workers[conn_id] = t
+                        t.start()
+                    state.wait(0.5)
+        finally:
+            with state:
+                if not errors and (blocks or workers):
+                    errors.append(IntegrityError("download aborted"))
+                state.notify_all()
+            for t in list(workers.values()):
+                t.join()
+            os.close(fd)
+            tuner.save()
+
+        if next_hash[0] != end + 1:
+            raise IntegrityError(f"range {start}-{end} incomplete")
+
+    def _download_verified(self, file, total_size, path, hasher):
+        """Download a whole file and check it against Content-Length and the source md5."""
+        for attempt in range(2):
+            self._download_range(file.link, 0, total_size - 1, path, 0, hasher)
+            try:
+                hasher.verify(total_size, file.md5)
+                return
+            except IntegrityError as e:
+                if attempt:
+                    raise
+                # A whole-file md5 cannot point at the bad range, so the file is fetched again
+                logger.warning(f"{path} failed verification ({e}), downloading again")
+                hasher.reset()
+                with self.progress_lock:
+                    if self.progress_bar:
+                        self.progress_bar.reset()
 
     def _make_streamable(self, src, dst):
         self._ensure_dir(dst)
@@ -80,16 +426,28 @@ class Downloader:
 
         cmd.append(dst)
 
-        subprocess.run(
-            cmd,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            check=True
-        )
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + REMUX_TIMEOUT
+        try:
+            while True:
+                try:
+                    returncode = proc.wait(timeout=1)
+                    break
+                except subprocess.TimeoutExpired:
+                    if time.monotonic() > deadline:
+                        raise subprocess.TimeoutExpired(cmd, REMUX_TIMEOUT)
+                    self._check_cancelled()
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
 
     def download(self, file: File, num_threads=1, on_part_ready=None):
         link = file.link
         dest = file.dest
+        hasher = StreamHasher()
 
         try:
             total_size, is_support_range = self._get_total_size(link)
@@ -99,33 +457,40 @@ class Downloader:
             needs_splitting = total_size > part_size
 
             display_name = os.path.basename(dest)
-            self.progress_bar = tqdm(
-                total=total_size,
-                unit='B',
-                unit_scale=True,
-                desc=f'Downloading {display_name[:25]}'
-            )
+            if self.shared_progress:
+                self.progress_bar = self.shared_progress.file(total_size)
+            else:
+                self.progress_bar = tqdm(
+                    total=total_size,
+                    unit='B',
+                    unit_scale=True,
+                    desc=f'Downloading {display_name[:25]}'
+                )
 
             self._ensure_dir(dest)
             base, ext = os.path.splitext(dest)
 
             if not needs_splitting:
-                if total_size <= ffmpeg_limit and ext.lower() in ['.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv', '.m4v']:
+                if self.remux and total_size <= ffmpeg_limit and ext.lower() in ['.mp4', '.mkv', '.avi', '.mov', '.webm', '.flv', '.m4v']:
                     raw_file = f"{base}.raw{ext}"
                     final_file = dest
 
-                    self._download_range(link, 0, total_size - 1, raw_file, 0)
+                    self._download_verified(file, total_size, raw_file, hasher)
 
                     try:
                         self._make_streamable(raw_file, final_file)
                         if os.path.exists(raw_file):
                             os.remove(raw_file)
+                    except DownloadCancelled:
+                        raise
                     except Exception as e:
                         logger.error(f"FFmpeg failed or not found, keeping raw file: {e}")
                         if os.path.exists(raw_file):
                             os.rename(raw_file, final_file)
                 else:
-                    self._download_range(link, 0, total_size - 1, dest, 0)
+                    self._download_verified(file, total_size, dest, hasher)
+
+                record(os.path.basename(dest), hasher, link)
 
                 if on_part_ready:
                     on_part_ready(dest, 1, 1, total_size)
@@ -139,11 +504,18 @@ class Downloader:
 
                     final_part = f"{base}.part{i+1:03d}{ext}"
 
-                    self._download_range(link, start, end, final_part, i)
+                    self._download_range(link, start, end, final_part, i, hasher)
 
                     if on_part_ready:
                         on_part_ready(final_part, i + 1, parts, end - start + 1)
 
+                # Parts are already delivered by now, so a mismatch can only be reported
+                try:
+                    hasher.verify(total_size, file.md5)
+                    record(os.path.basename(dest), hasher, link)
+                except IntegrityError as e:
+                    logger.error(f"split download of {dest} failed verification: {e}")
+
             self.progress_bar.close()
 
         except Exception as e:
@@ -170,20 +542,115 @@ class GoFile(metaclass=GoFileMeta):
     def __init__(self) -> None:
         self.token = ""
         self.wt = ""
+        self.token_expires = 0.0
+        self.wt_expires = 0.0
         self.lock = Lock()
+        self._stop_refresh = Event()
+        self._load_credentials()
+        self._refresher = Thread(target=self._refresh_loop, name="gofile-refresh", daemon=True)
+        self._refresher.start()
 
-    def update_token(self) -> None:
-        if self.token == "":
-            data = requests.post("https://api.gofile.io/accounts").json()
-            if data["status"] == "ok":
-                self.token = data["data"]["token"]
-            else:
-                raise Exception("cannot get token")
-
-    def update_wt(self) -> None:
-        if self.wt == "":
-            alljs = requests.get("https://gofile.io/dist/js/config.js").text
-            self.wt = alljs.split('appdata.wt = "')[1].split('"')[0]
+    def _load_credentials(self) -> None:
+        try:
+            with open(CREDENTIALS_FILE) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        if data.get("token_expires", 0) > now:
+            self.token = data.get("token", "")
+            self.token_expires = data["token_expires"]
+        if data.get("wt_expires", 0) > now:
+            self.wt = data.get("wt", "")
+            self.wt_expires = data["wt_expires"]
+        if self.token or self.wt:
+            logger.info("loaded cached GoFile credentials")
+
+    def _save_credentials(self) -> None:
+        data = {
+            "token": self.token,
+            "token_expires": self.token_expires,
+            "wt": self.wt,
+            "wt_expires": self.wt_expires,
+        }
+        # A private temp file, so several worker processes saving at once never share one
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(CREDENTIALS_FILE)), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, CREDENTIALS_FILE)
+        except OSError as e:
+            logger.warning(f"cannot persist GoFile credentials: {e}")
+
+    def _refresh_loop(self) -> None:
+        while not self._stop_refresh.is_set():
+            now = time.time()
+            try:
+                if self.token and self.token_expires - now < REFRESH_MARGIN:
+                    self.update_token(force=True)
+                if self.wt and self.wt_expires - now < REFRESH_MARGIN:
+                    self.update_wt(force=True)
+            except Exception as e:
+                logger.warning(f"background credential refresh failed: {e}")
+            expiries = [t for t in (self.token_expires, self.wt_expires) if t]
+            wait = min(expiries) - REFRESH_MARGIN - time.time() if expiries else REFRESH_MARGIN
+            self._stop_refresh.wait(max(60, wait))
+
+    # The network calls run outside self.lock, so a slow refresh never blocks
+    # readers of the current credentials; only the swap is locked
+    def update_token(self, force: bool = False) -> None:
+        with self.lock:
+            if not (force or self.token == "" or time.time() >= self.token_expires):
+                return
+        data = requests.post("https://api.gofile.io/accounts", timeout=API_TIMEOUT).json()
+        if data["status"] != "ok":
+            raise Exception("cannot get token")
+        with self.lock:
+            self.token = data["data"]["token"]
+            self.token_expires = time.time() + TOKEN_TTL
+            self._save_credentials()
+
+    def update_wt(self, force: bool = False) -> None:
+        with self.lock:
+            if not (force or self.wt == "" or time.time() >= self.wt_expires):
+                return
+        alljs = requests.get("https://gofile.io/dist/js/config.js", timeout=API_TIMEOUT).text
+        wt = alljs.split('appdata.wt = "')[1].split('"')[0]
+        with self.lock:
+            self.wt = wt
+            self.wt_expires = time.time() + WT_TTL
+            self._save_credentials()
+
+    def invalidate(self) -> None:
+        """Drop cached credentials after the API rejected them."""
+        with self.lock:
+            self.token, self.token_expires = "", 0.0
+            self.wt, self.wt_expires = "", 0.0
+            self._save_credentials()
+
+    def api_get(self, url: str) -> dict:
+        """GET a GoFile API endpoint, refreshing credentials once on auth errors."""
+        for attempt in range(2):
+            self.update_token()
+            self.update_wt()
+            r = requests.get(
+                url,
+                headers={
+                    "Authorization": "Bearer " + self.token,
+                    "X-Website-Token": self.wt,
+                },
+                timeout=API_TIMEOUT,
+            )
+            try:
+                data = r.json()
+            except ValueError:
+                data = {"status": f"error-http-{r.status_code}"}
+            if attempt == 0 and (r.status_code in (401, 403) or data.get("status") in AUTH_ERRORS):
+                logger.warning(f"GoFile rejected credentials ({data.get('status')}), refreshing")
+                self.invalidate()
+                continue
+            return data
+        return data
 
     def execute(
         self,
@@ -197,9 +664,53 @@ class GoFile(metaclass=GoFileMeta):
         excludes: list[str] = None
     ) -> None:
 
-        files = self.get_files(dir, content_id, url, password, includes, excludes)
-        for file in files:
-            Downloader(token=self.token).download(file, num_threads=1)
+        """Download every file under a GoFile link, num_threads files at a time."""
+        if proxy:
+            # One proxy, or a comma-separated list to spread connections over
+            egress.pool.configure(proxy.split(","))
+
+        progress = AggregateProgress()
+
+        def download_one(file):
+            try:
+                Downloader(token=self.token, progress=progress).download(file)
+                progress.finish(True)
+            except Exception:
+                # download() has already logged the failure
+                progress.finish(False)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, num_threads)) as executor:
+                # Files are queued as the folder walk finds them
+                futures = [
+                    executor.submit(download_one, file)
+                    for file in self.iter_files(dir, content_id, url, password, includes, excludes)
+                ]
+                for future in as_completed(futures):
+                    future.result()
+        finally:
+            progress.close()
+            logger.info(progress.summary())
+
+    def get_total_size(self, content_id: str, password: str = None, recursive: bool = True) -> int:
+        """Sum of all file sizes under a content id, without creating any directories.
+
+        With recursive=False only the files directly in the folder are counted,
+        which costs a single API call.
+        """
+        hash_password = hashlib.sha256(password.encode()).hexdigest() if password else ""
+        data = self.api_get(f"https://api.gofile.io/contents/{content_id}?cache=true&password={hash_password}")
+        if data["status"] != "ok":
+            return 0
+        if data["data"]["type"] != "folder":
+            return data["data"].get("size", 0)
+        total = 0
+        for child in data["data"]["children"].values():
+            if child["type"] == "file":
+                total += child.get("size", 0)
+            elif child["type"] == "folder" and recursive:
+                total += self.get_total_size(child["id"], password)
+        return total
 
     def is_included(self, filename: str, includes: list[str]) -> bool:
         return True if not includes else any(fnmatch.fnmatch(filename, p) for p in includes)
@@ -207,7 +718,7 @@ class GoFile(metaclass=GoFileMeta):
     def is_excluded(self, filename: str, excludes: list[str]) -> bool:
         return False if not excludes else any(fnmatch.fnmatch(filename, p) for p in excludes)
 
-    def get_files(
+    def iter_files(
         self,
         dir: str,
         content_id: str = None,
@@ -215,24 +726,16 @@ class GoFile(metaclass=GoFileMeta):
         password: str = None,
         includes: list[str] = None,
         excludes: list[str] = None
-    ) -> list[File]:
-
+    ):
+        """Yield files as folders are listed, so downloads can start before the walk ends."""
         includes = includes or []
         excludes = excludes or []
-        files = []
 
         if content_id:
-            self.update_token()
-            self.update_wt()
-
             hash_password = hashlib.sha256(password.encode()).hexdigest() if password else ""
-            data = requests.get(
-                f"https://api.gofile.io/contents/{content_id}?cache=true&password={hash_password}",
-                headers={
-                    "Authorization": "Bearer " + self.token,
-                    "X-Website-Token": self.wt,
-                },
-            ).json()
+            data = self.api_get(
+                f"https://api.gofile.io/contents/{content_id}?cache=true&password={hash_password}"
+            )
 
             if data["status"] == "ok":
                 if data["data"]["type"] == "folder":
@@ -242,30 +745,62 @@ class GoFile(metaclass=GoFileMeta):
                     for cid, child in data["data"]["children"].items():
                         if child["type"] == "file":
                             name = child["name"]
-                            files.append(File(child["link"], os.path.join(dir, sanitize_filename(name))))
+                            if not self.is_included(name, includes) or self.is_excluded(name, excludes):
+                                continue
+                            yield File(child["link"], os.path.join(dir, sanitize_filename(name)), child.get("md5"))
                         elif child["type"] == "folder":
-                            files.extend(self.get_files(
+                            yield from self.iter_files(
                                 dir,
                                 content_id=child["id"],
                                 password=password,
                                 includes=includes,
                                 excludes=excludes
-                            ))
+                            )
                 else:
                     name = data["data"]["name"]
                     os.makedirs(dir, exist_ok=True)
-                    files.append(File(data["data"]["link"], os.path.join(dir, sanitize_filename(name))))
+                    yield File(data["data"]["link"], os.path.join(dir, sanitize_filename(name)), data["data"].get("md5"))
 
         elif url and "gofile.io/d/" in url:
             content_id = url.split("/d/")[-1].split("?")[0].strip("/")
-            files = self.get_files(dir, content_id=content_id, password=password)
+            yield from self.iter_files(
+                dir,
+                content_id=content_id,
+                password=password,
+                includes=includes,
+                excludes=excludes
+            )
 
-        return files
+    def get_files(
+        self,
+        dir: str,
+        content_id: str = None,
+        url: str = None,
+        password: str = None,
+        includes: list[str] = None,
+        excludes: list[str] = None
+    ) -> list[File]:
+        return list(self.iter_files(dir, content_id, url, password, includes, excludes))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("url")
     parser.add_argument("-d", type=str, dest="dir", default="./output")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="files to download in parallel")
+    parser.add_argument("-i", "--include", action="append", dest="includes", default=[],
+                        help="only download file names matching this glob (repeatable)")
+    parser.add_argument("-e", "--exclude", action="append", dest="excludes", default=[],
+                        help="skip file names matching this glob (repeatable)")
+    parser.add_argument("-p", "--password", type=str, default=None)
+    parser.add_argument("--proxy", type=str, default=None, help="proxy URL(s), comma-separated")
     args = parser.parse_args()
 
-    GoFile().execute(dir=args.dir, url=args.url)
+    GoFile().execute(
+        dir=args.dir,
+        url=args.url,
+        password=args.password,
+        proxy=args.proxy,
+        num_threads=args.jobs,
+        includes=args.includes,
+        excludes=args.excludes
+    )
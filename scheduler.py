@@ -0,0 +1,268 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import shutil
+import signal
+import threading
+import time
+
+log = logging.getLogger("SCHEDULER")
+
+PRIORITY_CLASSES = {"high": 0, "normal": 1, "bulk": 2}
+# Jobs whose size cannot be estimated sort as if they were this large
+UNKNOWN_SIZE = 1024 * 1024 * 1024
+
+# The job the running code belongs to; asyncio.to_thread copies it into worker threads
+current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class Job:
+    def __init__(self, job_id: int, url: str, priority: str = "normal", size: int = None,
+                 message=None, status=None):
+        self.id = job_id
+        self.url = url
+        self.priority = priority
+        self.size = size
+        # The request that created the job and the message its progress is rendered into
+        self.message = message
+        self.status = status
+        self.state = "queued"
+        self.created = time.time()
+        self.task = None
+        self.reserved = 0
+        # Checked by download threads, which cannot be cancelled from asyncio
+        self.cancel_event = threading.Event()
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    def sort_key(self):
+        # Priority class first, then shortest job first, then arrival order
+        size = self.size if self.size else UNKNOWN_SIZE
+        return (PRIORITY_CLASSES.get(self.priority, 1), size, self.id)
+
+    def track(self, proc) -> None:
+        with self.lock:
+            self.processes.add(proc)
+        if self.cancel_event.is_set():
+            self._kill(proc)
+
+    def untrack(self, proc) -> None:
+        with self.lock:
+            self.processes.discard(proc)
+
+    @staticmethod
+    def _kill(proc) -> None:
+        kill_process(proc)
+
+    def abort(self) -> None:
+        """Stop everything the job has in flight: threads, child processes and its task."""
+        self.cancel_event.set()
+        with self.lock:
+            procs = list(self.processes)
+        for proc in procs:
+            self._kill(proc)
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    def describe(self) -> str:
+        size = f"{self.size / 1024 / 1024:.0f}MB" if self.size else "size ?"
+        return f"#{self.id} [{self.priority}] {self.state} {size} {self.url[:60]}"
+
+
+def kill_process(proc) -> None:
+    """Kill a child process, and its whole process group if it was started in its own session.
+
+    yt-dlp runs ffmpeg for merges; started with start_new_session=True that
+    child goes down with it instead of being orphaned.
+    """
+    try:
+        if os.getpgid(proc.pid) == proc.pid:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, OSError):
+        pass
+
+
+def track_process(proc) -> None:
+    job = current_job.get()
+    if job:
+        job.track(proc)
+
+
+def untrack_process(proc) -> None:
+    job = current_job.get()
+    if job:
+        job.untrack(proc)
+
+
+class Scheduler:
+    """Runs jobs by priority class and shortest-job-first within a fixed number of slots.
+
+    Each running job holds a disk reservation for its estimated size; a job is
+    only started while the reservation fits in free space, unless nothing else
+    is running.
+    """
+
+    def __init__(self, runner, slots: int = 2, disk_path: str = ".", min_free: int = 0):
+        self.runner = runner
+        self.slots = slots
+        self.disk_path = disk_path
+        self.min_free = min_free
+        self.jobs = {}
+        self.queue = []
+        self.running = set()
+        self.paused = False
+        self.reserved = 0
+        self.ids = itertools.count(1)
+        self.wakeup = asyncio.Event()
+        self.loop_task = None
+
+    def start(self) -> None:
+        if self.loop_task is None:
+            self.loop_task = asyncio.create_task(self._dispatch_loop())
+
+    def submit(self, url: str, priority: str = "normal", size: int = None, message=None, status=None,
+               job_id: int = None) -> Job:
+        """Queue a job. job_id lets a worker reuse the id its coordinator assigned."""
+        job = Job(job_id or next(self.ids), url, priority, size, message, status)
+        self.jobs[job.id] = job
+        self._enqueue(job)
+        return job
+
+    def _enqueue(self, job: Job) -> None:
+        job.state = "queued"
+        heapq.heappush(self.queue, (job.sort_key(), job.id))
+        self.wakeup.set()
+
+    def resize(self, job: Job, size: int, priority: str = None) -> None:
+        """Apply a size estimate that arrived after the job was submitted."""
+        job.size = size
+        if priority:
+            job.priority = priority
+        if job.state == "queued":
+            # The old heap entry no longer matches the sort key and is skipped
+            self._enqueue(job)
+
+    def _forget(self, job: Job) -> None:
+        """Drop a finished job; its heap entries are skipped once it is gone."""
+        if job.state in ("done", "failed", "cancelled"):
+            self.discard(job)
+
+    def discard(self, job: Job) -> None:
+        """Drop a job that is not running and will not be resumed here, whatever its state."""
+        if job not in self.running:
+            self.jobs.pop(job.id, None)
+
+    def position(self, job: Job) -> int:
+        # Counted from the jobs themselves: the heap also holds stale entries of
+        # resized and resumed jobs
+        key = job.sort_key()
+        return sum(1 for other in self.jobs.values() if other.state == "queued" and other.sort_key() < key) + 1
+
+    def cancel(self, job_id: int) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or job.state in ("done", "failed", "cancelled"):
+            return False
+        was_running = job.state == "running"
+        job.state = "cancelled"
+        if was_running:
+            job.abort()
+        else:
+            self._forget(job)
+        return True
+
+    def pause_job(self, job_id: int) -> bool:
+        """Abort a job's in-flight work and park it until resume_job."""
+        job = self.jobs.get(job_id)
+        if not job or job.state not in ("queued", "running"):
+            return False
+        was_running = job.state == "running"
+        job.state = "paused"
+        if was_running:
+            job.abort()
+        return True
+
+    def resume_job(self, job_id: int) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or job.state != "paused" or job in self.running:
+            return False
+        self._enqueue(job)
+        return True
+
+    def pause(self) -> None:
+        self.paused = True
+
+    def resume(self) -> None:
+        self.paused = False
+        self.wakeup.set()
+
+    def active(self) -> list:
+        return [j for j in self.jobs.values() if j.state in ("queued", "running", "paused")]
+
+    def _fits(self, job: Job) -> bool:
+        if not self.running:
+            return True
+        free = shutil.disk_usage(self.disk_path).free
+        need = job.size if job.size else 0
+        return free - self.reserved - need >= self.min_free
+
+    def _next_job(self):
+        skipped = []
+        chosen = None
+        while self.queue:
+            key, jid = heapq.heappop(self.queue)
+            job = self.jobs.get(jid)
+            if job is None or job.state != "queued" or key != job.sort_key():
+                continue
+            if self._fits(job):
+                chosen = job
+                break
+            skipped.append((key, jid))
+        for item in skipped:
+            heapq.heappush(self.queue, item)
+        return chosen
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while not self.paused and len(self.running) < self.slots:
+                job = self._next_job()
+                if job is None:
+                    break
+                self._start(job)
+
+    def _start(self, job: Job) -> None:
+        job.state = "running"
+        job.reserved = job.size or 0
+        self.reserved += job.reserved
+        # A fresh event per run, so threads left over from an aborted run stay stopped
+        job.cancel_event = threading.Event()
+        self.running.add(job)
+        job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: Job) -> None:
+        # Tasks run in a copy of the context, so this is only visible to the job's own code
+        current_job.set(job)
+        try:
+            await self.runner(job)
+            if job.state == "running":
+                job.state = "done"
+        except asyncio.CancelledError:
+            log.info(f"Job {job.id} stopped ({job.state})")
+        except Exception as e:
+            log.exception(e)
+            job.state = "failed"
+        finally:
+            self.running.discard(job)
+            self.reserved -= job.reserved
+            job.reserved = 0
+            with job.lock:
+                job.processes.clear()
+            # Paused jobs stay known so they can be resumed
+            self._forget(job)
+            self.wakeup.set()
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+import cloudscraper
+
+from tuner import host_key
+
+log = logging.getLogger("SCRAPERS")
+
+SCRAPER_COOKIES_FILE = os.getenv("SCRAPER_COOKIES_FILE", ".scraper_cookies.json")
+# Sessions kept (and lent out at once) per domain and egress route
+SCRAPER_POOL_SIZE = int(os.getenv("SCRAPER_POOL_SIZE", "4"))
+# Cloudflare clearance without an expiry is assumed to last this long
+DEFAULT_COOKIE_TTL = 30 * 60
+SESSION_MAX_AGE = 6 * 3600
+# A session that hits this many challenge/blocked responses in a row is dropped
+MAX_BLOCKED = 2
+BLOCKED_STATUSES = (403, 429, 503)
+
+BROWSER = {'browser': 'chrome', 'platform': 'windows', 'mobile': False}
+
+_file_lock = Lock()
+
+
+def _load_state() -> dict:
+    try:
+        with open(SCRAPER_COOKIES_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state: dict) -> None:
+    # A private temp file (mkstemp creates it 0600), so worker processes saving
+    # at once never share one; _file_lock only covers threads of this process
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(SCRAPER_COOKIES_FILE)), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, SCRAPER_COOKIES_FILE)
+    except OSError as e:
+        log.warning(f"cannot persist scraper cookies: {e}")
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class PooledScraper:
+    """A cloudscraper session plus the bookkeeping the pool needs to judge its health."""
+
+    def __init__(self, key: str, route=None):
+        self.key = key
+        self.scraper = cloudscraper.create_scraper(browser=BROWSER)
+        if route:
+            route.apply(self.scraper)
+        self.created = time.time()
+        self.blocked = 0
+        self.scraper.hooks["response"].append(self._on_response)
+
+    def _on_response(self, r, *args, **kwargs):
+        if r.status_code in BLOCKED_STATUSES:
+            self.blocked += 1
+        elif r.status_code < 400:
+            self.blocked = 0
+
+    @property
+    def cleared(self) -> bool:
+        return self.blocked < MAX_BLOCKED
+
+    @property
+    def healthy(self) -> bool:
+        return self.cleared and time.time() - self.created < SESSION_MAX_AGE
+
+    def restore(self, saved: dict) -> int:
+        """Load unexpired cookies (and the User-Agent they were issued to) from disk."""
+        now = time.time()
+        restored = 0
+        for c in saved.get("cookies", []):
+            if c.get("expires") and c["expires"] <= now:
+                continue
+            self.scraper.cookies.set(c["name"], c["value"], domain=c["domain"], path=c["path"],
+                                     expires=c["expires"], secure=c["secure"])
+            restored += 1
+        # Cloudflare ties clearance to the browser that solved the challenge
+        if restored and saved.get("user_agent"):
+            self.scraper.headers["User-Agent"] = saved["user_agent"]
+        return restored
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        cookies = []
+        for c in self.scraper.cookies:
+            expires = c.expires or int(now + DEFAULT_COOKIE_TTL)
+            if expires > now:
+                cookies.append({"name": c.name, "value": c.value, "domain": c.domain,
+                                "path": c.path, "expires": expires, "secure": c.secure})
+        return {"user_agent": self.scraper.headers.get("User-Agent"), "cookies": cookies}
+
+
+class ScraperPool:
+    """Long-lived Cloudflare-cleared scraper sessions, lent out per domain.
+
+    Sessions keep their keep-alive connections and clearance cookies between
+    scrapes; cookies are also persisted with their expiry so a restart does
+    not solve the challenge again. A session that keeps getting blocked is
+    dropped together with its saved cookies; one that grows too old is
+    just replaced.
+    """
+
+    def __init__(self, size: int = SCRAPER_POOL_SIZE):
+        self.size = size
+        self.cond = Condition()
+        self.idle = {}
+        self.lent = {}
+
+    @staticmethod
+    def _key(url: str, route=None) -> str:
+        # Clearance is per IP, so every egress route keeps its own sessions
+        return f"{host_key(url)}|{route.name if route else 'direct'}"
+
+    def _create(self, key: str, route=None) -> PooledScraper:
+        pooled = PooledScraper(key, route)
+        with _file_lock:
+            saved = _load_state().get(key, {})
+        if pooled.restore(saved):
+            log.info(f"{key}: reusing saved clearance")
+        return pooled
+
+    def acquire(self, url: str, route=None) -> PooledScraper:
+        key = self._key(url, route)
+        with self.cond:
+            while True:
+                idle = self.idle.setdefault(key, [])
+                while idle:
+                    pooled = idle.pop()
+                    if pooled.healthy:
+                        self.lent[key] = self.lent.get(key, 0) + 1
+                        return pooled
+                    pooled.scraper.close()
+                if self.lent.get(key, 0) < self.size:
+                    self.lent[key] = self.lent.get(key, 0) + 1
+                    break
+                self.cond.wait()
+        try:
+            return self._create(key, route)
+        except Exception:
+            with self.cond:
+                self.lent[key] -= 1
+                self.cond.notify_all()
+            raise
+
+    def release(self, pooled: PooledScraper) -> None:
+        healthy = pooled.healthy
+        with _file_lock:
+            state = _load_state()
+            if pooled.cleared:
+                state[pooled.key] = pooled.snapshot()
+            else:
+                # Saved cookies of a blocked session would only get the next one blocked too
+                state.pop(pooled.key, None)
+            _save_state(state)
+        with self.cond:
+            self.lent[pooled.key] -= 1
+            if healthy:
+                self.idle.setdefault(pooled.key, []).append(pooled)
+            else:
+                log.info(f"{pooled.key}: retiring session ({pooled.blocked} blocked responses)")
+                pooled.scraper.close()
+            self.cond.notify_all()
+
+    @contextmanager
+    def session(self, url: str, route=None):
+        """Borrow a scraper session for url's domain for the length of the block."""
+        pooled = self.acquire(url, route)
+        try:
+            yield pooled.scraper
+        finally:
+            self.release(pooled)
+
+
+pool = ScraperPool()
@@ -0,0 +1,108 @@
+import io
+import logging
+import os
+import threading
+
+log = logging.getLogger("SPOOL")
+
+# Items up to SPOOL_MAX_ITEM bytes are kept in RAM instead of DOWNLOAD_DIR,
+# as long as the total across all in-flight items stays under SPOOL_RAM_BUDGET.
+SPOOL_ENABLED = os.getenv("SPOOL_ENABLED", "1") == "1"
+SPOOL_MAX_ITEM = int(os.getenv("SPOOL_MAX_ITEM_MB", "20")) * 1024 * 1024
+SPOOL_RAM_BUDGET = int(os.getenv("SPOOL_RAM_BUDGET_MB", "256")) * 1024 * 1024
+
+
+class MemoryBudget:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def try_reserve(self, size: int) -> bool:
+        with self.lock:
+            if self.used + size > self.limit:
+                return False
+            self.used += size
+            return True
+
+    def release(self, size: int) -> None:
+        with self.lock:
+            self.used = max(0, self.used - size)
+
+
+budget = MemoryBudget(SPOOL_RAM_BUDGET)
+
+
+class MemorySpool(io.BytesIO):
+    """A named in-memory file that pyrogram can upload like a path.
+
+    Holds a reservation against the global budget until release() is called.
+    """
+
+    def __init__(self, name: str, reserved: int):
+        super().__init__()
+        self.name = name
+        self.reserved = reserved
+
+    def write(self, data) -> int:
+        if self.tell() + len(data) > self.reserved:
+            raise SpoolOverflow(self.name)
+        return super().write(data)
+
+    def shrink(self) -> None:
+        """Give back the part of the reservation the body did not use."""
+        used = self.getbuffer().nbytes
+        if self.reserved > used:
+            budget.release(self.reserved - used)
+            self.reserved = used
+
+    def release(self) -> None:
+        budget.release(self.reserved)
+        self.reserved = 0
+        self.close()
+
+    def spill(self, path) -> str:
+        """Write the buffered bytes to disk and free the reservation."""
+        with open(path, "wb") as f:
+            f.write(self.getbuffer())
+        self.release()
+        return str(path)
+
+
+class SpoolOverflow(Exception):
+    pass
+
+
+def open_spool(name: str, size: int = 0):
+    """Reserve RAM for an item and return a MemorySpool, or None if it should go to disk.
+
+    With an unknown size (0) the full per-item limit is reserved; the writer
+    gets SpoolOverflow if the body turns out to be larger.
+    """
+    if not SPOOL_ENABLED or size > SPOOL_MAX_ITEM:
+        return None
+    reserve = size or SPOOL_MAX_ITEM
+    if not budget.try_reserve(reserve):
+        log.info(f"RAM budget exhausted, spooling {name} to disk")
+        return None
+    return MemorySpool(name, reserve)
+
+
+def is_spooled(item) -> bool:
+    return isinstance(item, MemorySpool)
+
+
+def item_size(item) -> int:
+    return item.getbuffer().nbytes if is_spooled(item) else os.path.getsize(item)
+
+
+def discard(item) -> None:
+    """Free an upload source, whether it is a spool, another buffer or a path on disk."""
+    if item is None:
+        return
+    if is_spooled(item):
+        item.release()
+    elif isinstance(item, io.IOBase):
+        item.close()
+    elif os.path.exists(item):
+        os.remove(item)
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from threading import Condition, Lock
+from urllib.parse import urlparse
+
+log = logging.getLogger("Tuner")
+
+TUNER_STATE_FILE = os.getenv("TUNER_STATE_FILE", ".tuner_state.json")
+TUNER_MAX_CONNECTIONS = int(os.getenv("TUNER_MAX_CONNECTIONS", "4"))
+
+# Per-host ceilings; hosts that punish parallelism get a low one
+HOST_LIMITS = {
+    "gofile.io": 8,
+    "pixeldrain.com": 4,
+    "bunkr": 4,
+    "cyberdrop": 2,
+}
+
+BLOCK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+DEFAULT_CHUNK = 256 * 1024
+# Aim for each read to carry roughly this much transfer time
+CHUNK_TARGET_SECONDS = 0.25
+CONTROL_INTERVAL = 2.0
+# Aggregate throughput must improve by this factor to keep adding connections
+GAIN_THRESHOLD = 1.05
+
+_state_lock = Lock()
+_tuners = {}
+_tuners_lock = Lock()
+
+
+def host_key(url: str) -> str:
+    host = urlparse(url).hostname or ""
+    parts = host.split(".")
+    if len(parts) <= 2 or parts[-1].isdigit():
+        return host
+    # CDN nodes (store1.gofile.io, ...) share what they learn with the whole domain
+    return ".".join(parts[-2:])
+
+
+def host_limit(host: str) -> int:
+    for pattern, limit in HOST_LIMITS.items():
+        if pattern in host:
+            return limit
+    return TUNER_MAX_CONNECTIONS
+
+
+def _load_state() -> dict:
+    try:
+        with open(TUNER_STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class HostTuner:
+    """AIMD controller for parallel ranged connections and read size against one host.
+
+    Connections are added one at a time while aggregate throughput keeps
+    improving and halved when the host throttles. The read size follows
+    per-connection throughput. Learned settings are persisted per host.
+    The connection count is enforced across all downloads from the host:
+    every request holds a slot().
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.max_connections = host_limit(host)
+        learned = _load_state().get(host, {})
+        self.connections = max(1, min(learned.get("connections", 2), self.max_connections))
+        self.chunk_size = learned.get("chunk_size", DEFAULT_CHUNK)
+        self.lock = Lock()
+        self.slots = Condition(self.lock)
+        self.active = 0
+        self.window_bytes = 0
+        self.window_start = time.monotonic()
+        self.last_rate = learned.get("rate", 0.0)
+        self.conn_rates = {}
+
+    def record(self, conn_id, nbytes: int, seconds: float) -> None:
+        with self.lock:
+            self.window_bytes += nbytes
+            if seconds > 0:
+                self.conn_rates[conn_id] = nbytes / seconds
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Take one of the host's connection slots, waiting up to timeout seconds."""
+        with self.slots:
+            if not self.slots.wait_for(lambda: self.active < self.connections, timeout):
+                return False
+            self.active += 1
+            return True
+
+    def release(self) -> None:
+        with self.slots:
+            self.active -= 1
+            self.slots.notify_all()
+
+    @contextmanager
+    def slot(self, check=None):
+        """Hold a connection slot for the block; check() runs while waiting, e.g. to honour cancellation."""
+        while not self.acquire(timeout=0.5):
+            if check:
+                check()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_throttle(self) -> None:
+        with self.lock:
+            before = self.connections
+            self.connections = max(1, self.connections // 2)
+            self.window_bytes = 0
+            self.window_start = time.monotonic()
+        if before != self.connections:
+            log.info(f"{self.host} throttled, connections {before} -> {self.connections}")
+
+    def tick(self) -> int:
+        """Re-evaluate the connection count once per CONTROL_INTERVAL and return it."""
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.window_start
+            if elapsed < CONTROL_INTERVAL:
+                return self.connections
+
+            rate = self.window_bytes / elapsed
+            before = self.connections
+            if rate > self.last_rate * GAIN_THRESHOLD:
+                self.connections = min(self.max_connections, self.connections + 1)
+            elif rate < self.last_rate / GAIN_THRESHOLD and self.connections > 1:
+                # The last connection we added made things worse
+                self.connections -= 1
+
+            if self.conn_rates:
+                per_conn = sum(self.conn_rates.values()) / len(self.conn_rates)
+                target = int(per_conn * CHUNK_TARGET_SECONDS)
+                self.chunk_size = max(MIN_CHUNK, min(MAX_CHUNK, 1 << max(0, target.bit_length() - 1)))
+
+            self.last_rate = rate
+            self.window_bytes = 0
+            self.window_start = now
+            self.conn_rates.clear()
+            if self.connections > before:
+                self.slots.notify_all()
+        if before != self.connections:
+            log.info(f"{self.host}: {rate / 1024 / 1024:.1f} MB/s, connections {before} -> {self.connections}")
+        return self.connections
+
+    def save(self) -> None:
+        with _state_lock:
+            state = _load_state()
+            state[self.host] = {
+                "connections": self.connections,
+                "chunk_size": self.chunk_size,
+                "rate": self.last_rate,
+            }
+            try:
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(TUNER_STATE_FILE)), suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(state, f)
+                os.replace(tmp, TUNER_STATE_FILE)
+            except OSError as e:
+                log.warning(f"cannot persist tuner state: {e}")
+
+
+def get_tuner(url: str) -> HostTuner:
+    host = host_key(url)
+    with _tuners_lock:
+        if host not in _tuners:
+            _tuners[host] = HostTuner(host)
+        return _tuners[host]